@@ -0,0 +1,119 @@
+'''
+Replay a corpus of recorded games against the engine, checking that every
+game plays out exactly as recorded, and report commands/sec per command type
+
+    python -m benchmarks.bench_replay corpus.bin
+    python -m benchmarks.bench_replay corpus.bin --generate 500
+
+Record a corpus from a running server with UNO_REPLAY_CORPUS=corpus.bin, or
+generate one from random self play with --generate. Exits with status 1 when
+any game diverges.
+'''
+import argparse
+import random
+import sys
+import time
+
+from src.replay import CorpusRecorder, replay_corpus
+from src.uno import Action, Color, GameController, GameStatus, Player, PlayerCommand, settings
+
+
+MAX_COMMANDS = 3000
+
+
+def command(gc, player, details):
+    return gc.process_player_command(player.player_id, details)
+
+
+def discard(gc, player, card, rng):
+    details = {'action': PlayerCommand.DISCARD, 'card': card}
+
+    if card.can_choose_card_color:
+        details['color_chosen'] = rng.choice([Color.RED, Color.GREEN, Color.BLUE, Color.YELLOW])
+    if len(player.hand) == 2 and rng.random() < 0.8:
+        details['say_uno'] = True
+
+    command(gc, player, details)
+
+
+def play_turn(gc, rng):
+    '''A random but legal turn for the current player, with the odd challenge or catch'''
+    player = gc.turn_tracker.get_current_turn_player()
+    previous = gc.turn_tracker.get_previous_turn_player()
+    last = gc.history[-1] if gc.history else None
+
+    if last and last['action'] == PlayerCommand.DISCARD and previous and rng.random() < 0.3:
+        if gc.discard_pile.get_last_card().action == Action.DRAW4 and gc.draw_stack_quantity:
+            command(gc, player, {'action': PlayerCommand.CHALLENGE})
+            return
+
+        if len(previous.hand) == 1 and not last.get('say_uno'):
+            command(gc, player, {'action': PlayerCommand.CATCH})
+            return
+
+    playable = [card for card in player.hand if gc.is_valid_card_to_play(card)]
+    if playable:
+        discard(gc, player, rng.choice(playable), rng)
+        return
+
+    stacked = gc.draw_stack_quantity
+    drawn = command(gc, player, {'action': PlayerCommand.DRAW})
+
+    # drawing a stack passes the turn on by itself
+    if not stacked:
+        if gc.is_valid_card_to_play(drawn[0]):
+            discard(gc, player, drawn[0], rng)
+        else:
+            command(gc, player, {'action': PlayerCommand.END_TURN})
+
+
+def generate(path, num_games, seed=0):
+    rng = random.Random(seed)
+    recorder = CorpusRecorder(path)
+
+    for _ in range(num_games):
+        gc = GameController(settings, seed=rng.randrange(2 ** 64))
+        recorder.watch(gc)
+
+        for idx in range(rng.randint(2, 6)):
+            Player(f'bot {idx}').join_game(gc)
+        gc.start()
+
+        while gc.get_status() != GameStatus.FINISHED and len(gc.history) < MAX_COMMANDS:
+            play_turn(gc, rng)
+
+    recorder.flush()
+    return recorder.games_written
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('corpus')
+    parser.add_argument('--generate', type=int, default=0, help='append this many self played games first')
+    args = parser.parse_args()
+
+    if args.generate:
+        written = generate(args.corpus, args.generate)
+        print(f'recorded {written} finished games of {args.generate} to {args.corpus}')
+
+    started = time.perf_counter()
+    games, failures, timings = replay_corpus(args.corpus)
+    elapsed = time.perf_counter() - started
+
+    for name, (count, seconds) in sorted(timings.items()):
+        print(f'{name:<10} {count:>9} commands {count / seconds:>12,.0f} commands/s')
+
+    total = sum(count for count, _ in timings.values())
+    print(f'replayed {games} games, {total} commands in {elapsed:.2f}s')
+
+    for idx, mismatches in failures.items():
+        for mismatch in mismatches:
+            print(f'game {idx}: {mismatch}')
+
+    if failures:
+        print(f'{len(failures)} of {games} games diverged')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+'''
+Time from a cold interpreter to the first served request
+
+    python -m benchmarks.bench_startup
+'''
+import subprocess
+import sys
+
+
+RUNS = 5
+
+PROBE = """
+import time
+started = time.perf_counter()
+
+from src.main import create_app
+imported = time.perf_counter()
+
+from fastapi.testclient import TestClient
+app = create_app()
+created = time.perf_counter()
+
+with TestClient(app) as client:
+    game_id = client.post('/game/new').json()['game_id']
+    client.get(f'/game/{game_id}/state')
+served = time.perf_counter()
+
+print(imported - started, created - imported, served - created)
+"""
+
+
+def main():
+    timings = []
+
+    for _ in range(RUNS):
+        out = subprocess.run(
+            [sys.executable, '-W', 'ignore', '-c', PROBE],
+            capture_output=True, text=True, check=True,
+        )
+        timings.append([float(t) for t in out.stdout.split()])
+
+    for i, name in enumerate(['import', 'create_app', 'first requests']):
+        best = min(t[i] for t in timings) * 1000
+        print(f'{name:<16} {best:8.1f} ms (best of {RUNS})')
+
+    print(f'{"total":<16} {min(sum(t) for t in timings) * 1000:8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
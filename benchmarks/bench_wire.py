@@ -0,0 +1,144 @@
+'''
+Compare the JSON + pydantic request path against the MessagePack bot path, and
+JSON against MessagePack through the whole route (validation, endpoint and
+encoding) of a running app
+
+    python -m benchmarks.bench_wire
+'''
+import asyncio
+import json
+import timeit
+
+from fastapi.encoders import jsonable_encoder
+
+from src import wire
+from src.main import DiscardOption, create_app
+from src.uno import Action, Card, Color, GameController, Player, card_to_id, settings
+
+
+ROUNDS = 20000
+ROUTE_ROUNDS = 2000
+
+
+def decode_json_discard(body):
+    discard_options = DiscardOption.model_validate(json.loads(body))
+    card_color = Color[discard_options.card.color.upper()] if discard_options.card.color else None
+    card_action = Action[discard_options.card.action.upper()] if discard_options.card.action else None
+    return Card(card_color, discard_options.card.number, card_action)
+
+
+def decode_msgpack_discard(body):
+    return wire.decode_bot_command(body)['card']
+
+
+def make_game():
+    gc = GameController(settings)
+    for name in ['a', 'b', 'c', 'd']:
+        Player(name).join_game(gc)
+    gc.start()
+    return gc
+
+
+def state_payload(gc):
+    return {
+        'top': gc.discard_pile.get_last_card(),
+        'color': gc.color_in_play,
+        'hands': {str(p.player_id): p.hand for p in gc.players},
+    }
+
+
+def report(name, seconds, rounds=ROUNDS):
+    print(f'{name:<32} {seconds / rounds * 1e6:8.2f} us/op')
+
+
+async def call(app, method, path, body=b'', content_type=None, accept=None):
+    '''One request straight through the ASGI app, no HTTP client or server in the way'''
+    headers = [(b'content-length', str(len(body)).encode())]
+    if content_type:
+        headers.append((b'content-type', content_type.encode()))
+    if accept:
+        headers.append((b'accept', accept.encode()))
+
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': b'',
+        'root_path': '',
+        'headers': headers,
+        'client': ('bench', 1),
+        'server': ('bench', 80),
+    }
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    sent = []
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    return sent
+
+
+async def time_route(app, rounds, *args, **kwargs):
+    started = asyncio.get_running_loop().time()
+    for _ in range(rounds):
+        await call(app, *args, **kwargs)
+    return asyncio.get_running_loop().time() - started
+
+
+async def bench_routes():
+    app = create_app({'turn_timeout': 0})
+    state = app.state.uno
+    gc = make_game()
+    state.watch_game(gc)
+    state.games.append(gc)
+    state.players.update((p.player_id, p) for p in gc.players)
+
+    path = f'/game/{gc.game_id}/state'
+    report('GET state json route', await time_route(app, ROUTE_ROUNDS, 'GET', path), ROUTE_ROUNDS)
+    report('GET state msgpack route', await time_route(app, ROUTE_ROUNDS, 'GET', path, accept=wire.MSGPACK), ROUTE_ROUNDS)
+
+    viewer = gc.players[0].player_id
+    path = f'/game/{gc.game_id}/player/{viewer}/view'
+    report('GET view json route', await time_route(app, ROUTE_ROUNDS, 'GET', path), ROUTE_ROUNDS)
+    report('GET view msgpack route', await time_route(app, ROUTE_ROUNDS, 'GET', path, accept=wire.MSGPACK), ROUTE_ROUNDS)
+
+    new_game = state.store.new_game
+    path = f'/game/{await new_game()}/player/new'
+    body = {'display_name': 'bench'}
+    report('POST player json route', await time_route(
+        app, ROUTE_ROUNDS, 'POST', path, json.dumps(body).encode(), 'application/json',
+    ), ROUTE_ROUNDS)
+    report('POST player msgpack route', await time_route(
+        app, ROUTE_ROUNDS, 'POST', path, wire.pack(body), wire.MSGPACK, wire.MSGPACK,
+    ), ROUTE_ROUNDS)
+
+
+def main():
+    card = Card(Color.YELLOW, 7, None)
+    json_body = json.dumps({'card': {'color': 'yellow', 'number': 7, 'action': None}, 'say_uno': False})
+    msgpack_body = wire.pack([card_to_id(card), None, False])
+
+    print(f'request bytes: json={len(json_body)} msgpack={len(msgpack_body)}')
+    report('decode json + pydantic', timeit.timeit(lambda: decode_json_discard(json_body), number=ROUNDS))
+    report('decode msgpack fast path', timeit.timeit(lambda: decode_msgpack_discard(msgpack_body), number=ROUNDS))
+
+    payload = state_payload(make_game())
+    json_state = json.dumps(jsonable_encoder(payload))
+    msgpack_state = wire.pack(payload)
+
+    print(f'state bytes: json={len(json_state)} msgpack={len(msgpack_state)}')
+    report('encode state json', timeit.timeit(lambda: json.dumps(jsonable_encoder(payload)), number=ROUNDS))
+    report('encode state msgpack', timeit.timeit(lambda: wire.pack(payload), number=ROUNDS))
+
+    asyncio.run(bench_routes())
+
+
+if __name__ == '__main__':
+    main()
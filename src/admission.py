@@ -0,0 +1,81 @@
+'''Admission control for player commands
+
+Every game's commands run one at a time under its lock in the game store, and
+the commands waiting their turn form that game's queue. Both the queue of every
+game and the number of commands admitted over all games are bounded: a command
+that would go over either bound is turned away at once instead of waiting.
+'''
+from contextlib import asynccontextmanager
+
+
+class UnoOverloaded(Exception):
+
+    def __init__(self, retry_after):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+class UnoGameBusy(UnoOverloaded):
+    '''The game's command queue is full'''
+    pass
+
+class UnoServerBusy(UnoOverloaded):
+    '''Too many commands in flight over all games'''
+    pass
+
+
+class AdmissionController:
+
+    def __init__(self, max_in_flight=64, max_queue_per_game=8, retry_after=1):
+        self.max_in_flight = max_in_flight
+        self.max_queue_per_game = max_queue_per_game
+        self.retry_after = retry_after
+
+        # only touched from the event loop, so no thread locks needed
+        self.in_flight = 0
+        self.depths = {} # game_id -> commands running or waiting
+
+        self.admitted = 0
+        self.rejected_game = 0
+        self.rejected_server = 0
+        self.peak_in_flight = 0
+
+    @asynccontextmanager
+    async def admit(self, game_id):
+        '''Count the command against its game's queue for the duration of the block'''
+        if self.in_flight >= self.max_in_flight:
+            self.rejected_server += 1
+            raise UnoServerBusy(self.retry_after)
+
+        depth = self.depths.get(game_id, 0)
+        if depth >= self.max_queue_per_game:
+            self.rejected_game += 1
+            raise UnoGameBusy(self.retry_after)
+
+        self.depths[game_id] = depth + 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+        try:
+            self.admitted += 1
+            yield
+        finally:
+            self.in_flight -= 1
+            self.depths[game_id] -= 1
+
+            if not self.depths[game_id]:
+                del self.depths[game_id]
+
+    def get_stats(self, top=10):
+        hottest = sorted(self.depths.items(), key=lambda item: item[1], reverse=True)[:top]
+
+        return {
+            'in_flight': self.in_flight,
+            'peak_in_flight': self.peak_in_flight,
+            'max_in_flight': self.max_in_flight,
+            'max_queue_per_game': self.max_queue_per_game,
+            'busy_games': len(self.depths),
+            'hottest_games': [{'game_id': game_id, 'queued': depth} for game_id, depth in hottest],
+            'admitted': self.admitted,
+            'rejected_game_busy': self.rejected_game,
+            'rejected_server_busy': self.rejected_server,
+        }
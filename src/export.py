@@ -0,0 +1,153 @@
+'''Streaming export of game histories for analytics
+
+Everything in here is a generator: games and their histories are walked one
+at a time so an export of the whole registry runs in bounded memory and can
+be streamed straight into a response while the server keeps playing games.
+'''
+from array import array
+from enum import Enum
+import json
+
+from .uno import Card, GameStatus
+
+
+# columns emitted by the columnar format, numeric ones are array backed
+NUMERIC_COLUMNS = {
+    'game_id': 'q',
+    'seq': 'l',
+    'timestamp': 'd',
+    'player_id': 'q',
+}
+TEXT_COLUMNS = [
+    'action',
+    'card',
+    'color_chosen',
+    'say_uno',
+    'result',
+]
+
+
+def iter_games(games, since=None, until=None, status=None):
+    '''Yield the games created in [since, until) with the given status'''
+
+    if isinstance(status, str):
+        status = GameStatus[status.upper()]
+
+    # iterate over a snapshot so games created mid-export don't break the walk
+    for g in list(games):
+        if since is not None and g.created_at < since:
+            continue
+
+        if until is not None and g.created_at >= until:
+            continue
+
+        if status is not None and g.get_status() != status:
+            continue
+
+        yield g
+
+
+def game_summary(g):
+    return {
+        'type': 'game',
+        'game_id': g.game_id,
+        'status': g.get_status().value,
+        'created_at': g.created_at,
+        'players': [p.player_id for p in list(g.players)],
+        'winners': [p.player_id for p in list(g.winners)],
+        'commands': len(g.history),
+    }
+
+
+def history_record(g, seq, item):
+    if 'challenge_succeeded' in item:
+        result = item['challenge_succeeded']
+    else:
+        result = item.get('success')
+
+    action = item.get('action')
+
+    return {
+        'type': 'event',
+        'game_id': g.game_id,
+        'seq': seq,
+        'timestamp': item.get('timestamp'),
+        'player_id': item.get('player_id'),
+        'action': action.name if action else None,
+        'card': encode_value(item.get('card')),
+        'color_chosen': encode_value(item.get('color_chosen')),
+        'say_uno': item.get('say_uno'),
+        'result': result,
+    }
+
+
+def iter_records(games, since=None, until=None, status=None):
+    '''Yield a summary record per game followed by one record per history item'''
+
+    for g in iter_games(games, since, until, status):
+        # copy the history so a live game appending to it can't disturb us
+        history = list(g.history)
+
+        yield game_summary(g)
+
+        for seq, item in enumerate(history):
+            yield history_record(g, seq, item)
+
+
+def iter_ndjson(games, since=None, until=None, status=None):
+    for record in iter_records(games, since, until, status):
+        yield json.dumps(record, default=encode_value) + '\n'
+
+
+def iter_columnar_batches(games, batch_size=1024, since=None, until=None, status=None):
+    '''
+    Yield history events in batches of at most batch_size rows, each batch being
+    a dict of column name -> array (numeric columns) or list (everything else)
+    '''
+
+    batch = new_batch()
+    rows = 0
+
+    for record in iter_records(games, since, until, status):
+        if record['type'] != 'event':
+            continue
+
+        for column, typecode in NUMERIC_COLUMNS.items():
+            value = record[column]
+            batch[column].append(value if value is not None else (0.0 if typecode == 'd' else 0))
+
+        for column in TEXT_COLUMNS:
+            batch[column].append(record[column])
+
+        rows += 1
+        if rows == batch_size:
+            yield batch
+            batch = new_batch()
+            rows = 0
+
+    if rows:
+        yield batch
+
+
+def iter_columnar_ndjson(games, batch_size=1024, since=None, until=None, status=None):
+    '''Columnar batches encoded one JSON object per line'''
+
+    for batch in iter_columnar_batches(games, batch_size, since, until, status):
+        line = {column: list(values) for column, values in batch.items()}
+        yield json.dumps(line, default=encode_value) + '\n'
+
+
+def new_batch():
+    batch = {column: array(typecode) for column, typecode in NUMERIC_COLUMNS.items()}
+    batch.update({column: [] for column in TEXT_COLUMNS})
+    return batch
+
+
+def encode_value(value):
+    if isinstance(value, Card):
+        return str(value)
+
+    if isinstance(value, Enum):
+        return value.value
+
+    return value
@@ -0,0 +1,93 @@
+'''Bounded response cache for idempotent player commands'''
+from collections import OrderedDict
+import asyncio
+import sys
+
+
+class ResponseCache:
+    '''
+    LRU of (idempotency key -> response). A retried command with a key that is
+    still cached gets the original response back without touching the game.
+    '''
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.pending = {} # key -> future of the response of a handler still running
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+
+    async def get_or_run(self, key, handler):
+        '''
+        Return the cached response for key, or await handler() and cache its
+        result. Exceptions are not cached so a failed command can be retried.
+        '''
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        # a concurrent retry waits for the first request of its key, other keys don't wait at all
+        pending = self.pending.get(key)
+        if pending is not None:
+            self.hits += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        future = self.pending[key] = asyncio.get_running_loop().create_future()
+
+        try:
+            response = await handler()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # retrieved here so an exception nobody else waited for isn't logged
+            future.exception()
+            raise
+        finally:
+            del self.pending[key]
+
+        self.put(key, response)
+        future.set_result(response)
+
+        return response
+
+    def put(self, key, response):
+        self.entries[key] = response
+        self.sizes[key] = approx_size(key) + approx_size(response)
+        self.bytes += self.sizes[key]
+
+        while len(self.entries) > self.max_entries:
+            old_key, _ = self.entries.popitem(last=False)
+            self.bytes -= self.sizes.pop(old_key)
+            self.evictions += 1
+
+    def get_stats(self):
+        return {
+            'entries': len(self.entries),
+            'max_entries': self.max_entries,
+            'approx_bytes': self.bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+def approx_size(obj):
+    '''Rough deep size in bytes of a response payload'''
+    size = sys.getsizeof(obj)
+
+    if isinstance(obj, dict):
+        size += sum(approx_size(k) + approx_size(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(approx_size(v) for v in obj)
+    elif hasattr(obj, '__dict__'):
+        size += approx_size(vars(obj))
+
+    return size
@@ -0,0 +1,205 @@
+'''Matchmaking lobby
+
+Players queue up with a table size and rule set, a background matcher pops
+full tables off the queues in batches and has the game store create, seat and
+start a game for each of them, so matched tables are played wherever the other
+games are, in process or on the engine shards. Clients wait on their ticket
+and are notified once. Matched tickets nobody collects are dropped after
+ticket_ttl seconds.
+'''
+from collections import deque
+import asyncio
+import itertools
+import threading
+import time
+
+from .uno import rule_sets
+
+
+class UnoLobbyTicketNotFound(Exception):
+    pass
+
+class UnoUnknownRuleSet(Exception):
+    pass
+
+
+class LobbyTicket:
+
+    def __init__(self, ticket_id, display_name, table_size, rule_set):
+        self.ticket_id = ticket_id
+        self.display_name = display_name
+        self.table_size = table_size
+        self.rule_set = rule_set
+        self.queued_at = time.time()
+
+        self.matched = False
+        self.matched_at = None
+        self.cancelled = False
+        self.game_id = None
+        self.player_id = None
+
+    def to_dict(self):
+        return {
+            'ticket_id': self.ticket_id,
+            'display_name': self.display_name,
+            'table_size': self.table_size,
+            'rule_set': self.rule_set,
+            'matched': self.matched,
+            'game_id': self.game_id,
+            'player_id': self.player_id,
+        }
+
+
+class Lobby:
+
+    def __init__(self, provision, max_tables_per_batch=500, ticket_ttl=300):
+        # GameStore.provision of the app, so matched games are playable right away
+        self.provision = provision
+        self.max_tables_per_batch = max_tables_per_batch
+        self.ticket_ttl = ticket_ttl
+
+        # never reused, a client polling an old ticket must not be handed someone else's seat
+        self.ticket_ids = itertools.count(1)
+        self.queues = {} # (table_size, rule_set) -> deque of tickets
+        self.tickets = {}
+        self.uncollected = deque() # matched tickets in match order, until they expire
+        self.waiters = {} # ticket_id -> asyncio.Event
+        self.lock = threading.Lock()
+
+    def enqueue(self, display_name, table_size, rule_set='default'):
+        if rule_set not in rule_sets:
+            raise UnoUnknownRuleSet(rule_set)
+
+        with self.lock:
+            ticket = LobbyTicket(next(self.ticket_ids), display_name, table_size, rule_set)
+            self.tickets[ticket.ticket_id] = ticket
+            self.queues.setdefault((table_size, rule_set), deque()).append(ticket)
+
+        return ticket
+
+    def get_ticket(self, ticket_id):
+        ticket = self.tickets.get(ticket_id)
+
+        if ticket is None:
+            raise UnoLobbyTicketNotFound
+
+        return ticket
+
+    def cancel(self, ticket_id):
+        '''Cancelled tickets are dropped lazily when the matcher reaches them'''
+        with self.lock:
+            ticket = self.get_ticket(ticket_id)
+
+            if ticket.matched:
+                return False
+
+            ticket.cancelled = True
+            self.tickets.pop(ticket_id)
+
+        # wake up anyone still long polling the ticket
+        event = self.waiters.pop(ticket_id, None)
+        if event:
+            event.set()
+
+        return True
+
+    def expire_tickets(self, now=None):
+        '''Drop matched tickets that were never collected within ticket_ttl'''
+        cutoff = (now or time.time()) - self.ticket_ttl
+
+        with self.lock:
+            while self.uncollected and self.uncollected[0].matched_at < cutoff:
+                ticket = self.uncollected.popleft()
+                self.tickets.pop(ticket.ticket_id, None)
+                self.waiters.pop(ticket.ticket_id, None)
+
+    def take_tables(self):
+        '''Pop up to max_tables_per_batch full tables off the queues'''
+        tables = []
+
+        with self.lock:
+            for (table_size, rule_set), queue in self.queues.items():
+                while len(tables) < self.max_tables_per_batch and len(queue) >= table_size:
+                    table = []
+                    while len(table) < table_size and queue:
+                        ticket = queue.popleft()
+                        if not ticket.cancelled:
+                            table.append(ticket)
+
+                    if len(table) < table_size:
+                        # cancelled tickets left the table short, put it back in front
+                        queue.extendleft(reversed(table))
+                        break
+
+                    tables.append((rule_set, table))
+
+        return tables
+
+    async def match(self):
+        '''Provision a game for every full table, returns the matched tickets'''
+        by_rule_set = {}
+        for rule_set, table in self.take_tables():
+            by_rule_set.setdefault(rule_set, []).append(table)
+
+        matched = []
+
+        # one provisioning call per rule set for the whole batch
+        for rule_set, tables in by_rule_set.items():
+            display_names = [[ticket.display_name for ticket in table] for table in tables]
+            provisioned = await self.provision(display_names, rule_set)
+
+            for table, (game_id, player_ids) in zip(tables, provisioned):
+                for ticket, player_id in zip(table, player_ids):
+                    ticket.game_id = game_id
+                    ticket.player_id = player_id
+                matched.extend(table)
+
+        now = time.time()
+        with self.lock:
+            for ticket in matched:
+                ticket.matched = True
+                ticket.matched_at = now
+            self.uncollected.extend(matched)
+
+        return matched
+
+    async def wait_for_match(self, ticket_id, timeout):
+        ticket = self.get_ticket(ticket_id)
+
+        if not ticket.matched:
+            event = self.waiters.setdefault(ticket_id, asyncio.Event())
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        if ticket.matched:
+            self.tickets.pop(ticket_id, None)
+            self.waiters.pop(ticket_id, None)
+
+        return ticket
+
+    async def run(self, interval=0.05):
+        '''Matcher loop, the store builds big batches of games off the event loop'''
+        while True:
+            matched = await self.match()
+
+            for ticket in matched:
+                event = self.waiters.get(ticket.ticket_id)
+                if event:
+                    event.set()
+
+            self.expire_tickets()
+            await asyncio.sleep(interval)
+
+    def get_stats(self):
+        with self.lock:
+            queued = {
+                f'{table_size}:{rule_set}': len(queue)
+                for (table_size, rule_set), queue in self.queues.items()
+            }
+
+        return {
+            'queued': queued,
+            'tickets': len(self.tickets),
+        }
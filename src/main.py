@@ -1,17 +1,90 @@
-from fastapi import Body, FastAPI
-from pydantic import BaseModel
+from fastapi import APIRouter, Body, Depends, FastAPI, Header, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
 
+from contextlib import asynccontextmanager
 from enum import Enum
 from typing import Optional
-
-from .uno import Card, Color, Action, GameController, Player, settings
-
-
-app = FastAPI()
-
-
-games = []
-players = []
+import asyncio
+import functools
+
+from . import export, wire
+from .admission import UnoGameBusy, UnoOverloaded
+from .idempotency import ResponseCache
+from .lobby import UnoLobbyTicketNotFound
+from .state import UnoState
+from . import tracing
+from .uno import (
+    Card, Color, Action, GameStatus,
+    UnoGameNotFoundException, UnoInvalidCardException, UnoInvalidTurnException, UnoPlayerNotFoundException,
+)
+
+
+router = APIRouter(route_class=wire.MsgPackRoute)
+
+
+def create_app(config=None):
+    '''
+    Build an app with its own games and players. config overrides the
+    environment defaults of state.default_config().
+    '''
+    state = UnoState(config)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        if state.shard_pool:
+            await state.shard_pool.start()
+
+        tasks = [
+            asyncio.create_task(state.lobby.run()),
+            asyncio.create_task(state.turn_timers.run()),
+            asyncio.create_task(state.persistence.run()),
+        ]
+        if state.recorder:
+            tasks.append(asyncio.create_task(state.recorder.run()))
+        if isinstance(state.tracer.exporter, tracing.FileExporter):
+            tasks.append(asyncio.create_task(state.tracer.exporter.run()))
+
+        yield
+        for task in tasks:
+            task.cancel()
+        # the recorder and the trace file write out what they still hold as they stop
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        if state.shard_pool:
+            await state.shard_pool.close()
+
+    app = FastAPI(lifespan=lifespan)
+    app.state.uno = state
+    app.include_router(router)
+
+    # the game store raises these for the ids in the path, every route answers them the same
+    @app.exception_handler(UnoGameNotFoundException)
+    async def game_not_found(request, exc):
+        game_id = request.path_params.get('game_id')
+        return JSONResponse(status_code=404, content={'detail': f'Game {game_id} not found'})
+
+    @app.exception_handler(UnoPlayerNotFoundException)
+    async def player_not_found(request, exc):
+        game_id = request.path_params.get('game_id')
+        # the bot state route takes player_id as a query parameter
+        player_id = request.path_params.get('player_id', request.query_params.get('player_id'))
+        return JSONResponse(status_code=404, content={'detail': f'Player {player_id} is not in game {game_id}'})
+
+    @app.middleware('http')
+    async def trace_requests(request, call_next):
+        tracer = request.app.state.uno.tracer
+        with tracing.request_trace(tracer, 'http', method=request.method, path=request.url.path) as span:
+            response = await call_next(request)
+            span.tag(status=response.status_code)
+
+        return response
+
+    return app
+
+
+async def get_state(request: Request):
+    return request.app.state.uno
 
 
 class PlayerModel(BaseModel):
@@ -46,51 +119,150 @@ class DiscardOption(BaseModel):
     say_uno: Optional[bool]
 
 
+class RuleSet(str, Enum):
+    DEFAULT = 'default'
+    QUICK = 'quick'
+
+
+class LobbyEntryModel(BaseModel):
+    display_name: str
+    table_size: int = Field(default=4, ge=2, le=10)
+    rule_set: RuleSet = RuleSet.DEFAULT
+
+
+class TableModel(BaseModel):
+    players: list[str] = Field(min_length=2, max_length=10)
+
+
+class ProvisionModel(BaseModel):
+    tables: list[TableModel] = Field(min_length=1, max_length=2000)
+    rule_set: RuleSet | None = None
+
+
+class BotCommand(str, Enum):
+    DISCARD = 'discard'
+    DRAW = 'draw'
+    KEEP = 'keep'
+    CHALLENGE = 'challenge'
+    CATCH = 'catch'
+
+
+class ExportFormat(str, Enum):
+    NDJSON = 'ndjson'
+    COLUMNAR = 'columnar'
+
+
+class GameStatusFilter(str, Enum):
+    WAITING = 'waiting'
+    IN_PROGRESS = 'in_progress'
+    FINISHED = 'finished'
+
+
+
+def idempotent(command):
+    '''
+    Player commands sent with an Idempotency-Key header are run once per key,
+    retries get the cached original response
+    '''
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(**kwargs):
+            key = kwargs.get('idempotency_key')
+            if key is None:
+                return await handler(**kwargs)
+
+            cache = kwargs['state'].get_response_cache(kwargs['game_id'])
+            cache_key = (kwargs['player_id'], command, key)
+            return await cache.get_or_run(cache_key, lambda: handler(**kwargs))
+
+        return wrapper
+
+    return decorator
+
+
+
+async def admit_command(game_id: int, player_id: int, state: UnoState = Depends(get_state)):
+    '''
+    Queue the command for its game, or turn it away with a 429 when the game's
+    queue is full and a 503 when the whole server is. Players not seated at the
+    game are answered 404 before taking a place in its queue.
+    '''
+    if not state.store.player_in_game(game_id, player_id):
+        raise HTTPException(status_code=404, detail=f'Player {player_id} is not in game {game_id}')
+
+    try:
+        async with state.admission.admit(game_id):
+            yield
+    except UnoOverloaded as e:
+        status_code = 429 if isinstance(e, UnoGameBusy) else 503
+        raise HTTPException(
+            status_code=status_code,
+            detail='Game is busy, retry later' if status_code == 429 else 'Server is busy, retry later',
+            headers={'Retry-After': str(e.retry_after)},
+        )
+
+
 
 # ---------- Game management ----------
 
-@app.post('/game/new', tags=['Game'])
-def new_game():
-    gc = GameController(settings)
-    games.append(gc)
+@router.post('/game/new', tags=['Game'])
+async def new_game(state: UnoState = Depends(get_state)):
+    game_id = await state.store.new_game()
 
     payload = {
         'success': True,
         'message': 'Game created successfully',
-        'game_id': gc.game_id,
+        'game_id': game_id,
     }
 
     return payload
 
 
-@app.get('/game/list', tags=['Game'])
-def list_games():
-    games_list = [g.game_id for g in games]
-    return games_list
+@router.get('/game/list', tags=['Game'])
+async def list_games(
+    status: GameStatusFilter | None = None,
+    players: int | None = None,
+    created_after: float | None = None,
+    created_before: float | None = None,
+    cursor: int | None = None,
+    limit: int = Query(default=50, ge=1, le=500),
+    state: UnoState = Depends(get_state),
+):
+    '''Games oldest first, pass back next_cursor to get the following page'''
+    game_status = GameStatus[status.upper()] if status else None
+    games_list, next_cursor = await state.store.list_games(
+        game_status, players, created_after, created_before, cursor, limit,
+    )
 
+    payload = {
+        'success': True,
+        'message': f'{len(games_list)} games',
+        'games': games_list,
+        'next_cursor': next_cursor,
+    }
 
-@app.post('/game/{game_id}/player/new', tags=['Game'])
-def new_player(game_id: int, player: PlayerModel):
-    p = Player(player.display_name)
-    players.append(p)
+    return payload
+
+
+@router.post('/game/{game_id}/player/new', tags=['Game'])
+async def new_player(game_id: int, player: PlayerModel, state: UnoState = Depends(get_state)):
+    player_id = await state.store.new_player(game_id, player.display_name)
 
     payload = {
         'success': True,
         'message': 'Player created successfully',
         'player': {
-            'display_name': p.display_name,
-            'player_id': p.player_id
+            'display_name': player.display_name,
+            'player_id': player_id
         }
     }
 
     return payload
 
 
-@app.post('/game/{game_id}/player/{player_id}/join', tags=['Game'])
-def join_game(game_id: int, player_id: int):
-    g = get_game_by_id(game_id)
-    p = get_player_by_id(player_id)
-    p.join_game(g)
+@router.post('/game/{game_id}/player/{player_id}/join', tags=['Game'])
+async def join_game(game_id: int, player_id: int, state: UnoState = Depends(get_state)):
+    await state.store.join(game_id, player_id)
 
     payload = {
         'success': True,
@@ -101,10 +273,9 @@ def join_game(game_id: int, player_id: int):
 
 
 
-@app.post('/game/{game_id}/start', tags=['Game'])
-def start_game(game_id: int):
-    g = get_game_by_id(game_id)
-    g.start()
+@router.post('/game/{game_id}/start', tags=['Game'])
+async def start_game(game_id: int, state: UnoState = Depends(get_state)):
+    await state.store.start(game_id)
 
     payload = {
         'success': True,
@@ -114,21 +285,35 @@ def start_game(game_id: int):
     return payload
 
 
-@app.get('/game/{game_id}/state', tags=['Game'])
-def game_state(game_id: int):
-    g = get_game_by_id(game_id)
-    gs = g.get_game_state()
+@router.post('/game/provision', tags=['Game'])
+async def provision(layout: ProvisionModel, state: UnoState = Depends(get_state)):
+    '''Create, seat and start every table of a tournament in one call'''
+    tables = [table.players for table in layout.tables]
+    provisioned = await state.store.provision(tables, layout.rule_set.value if layout.rule_set else None)
 
-    if gs.get('current_turn_player'):
-        gs['current_turn_player'] = get_short_player(gs['current_turn_player'])
+    games_list = [
+        {
+            'game_id': game_id,
+            'players': [
+                {'display_name': name, 'player_id': player_id}
+                for name, player_id in zip(table, player_ids)
+            ],
+        }
+        for table, (game_id, player_ids) in zip(tables, provisioned)
+    ]
+
+    payload = {
+        'success': True,
+        'message': f'{len(games_list)} games started',
+        'games': games_list,
+    }
+
+    return payload
 
-    if gs.get('players_all'):
-        players = [get_short_player(p) for p in gs['players_all']]
-        gs['players_all'] = players
 
-    if gs.get('players_in_game'):
-        players = [get_short_player(p) for p in gs['players_in_game']]
-        gs['players_in_game'] = players
+@router.get('/game/{game_id}/state', tags=['Game'])
+async def game_state(game_id: int, state: UnoState = Depends(get_state)):
+    gs = await state.store.state(game_id)
 
     payload = {
         'success': True,
@@ -140,22 +325,163 @@ def game_state(game_id: int):
 
 
 
+@router.get('/game/{game_id}/player/{player_id}/view', tags=['Game'])
+async def player_view(
+    game_id: int,
+    player_id: int,
+    since: int | None = None,
+    state: UnoState = Depends(get_state),
+):
+    '''
+    The game as player_id sees it: their own hand, the hand sizes of the others
+    and the public events after version `since`
+    '''
+    view = await state.store.view(game_id, player_id, since)
+
+    payload = {
+        'success': True,
+        'message': f'game {game_id} as seen by player {player_id}',
+        'view': view,
+    }
+
+    return payload
+
+
+
+# ---------- Lobby ----------
+
+@router.post('/lobby/enqueue', tags=['Lobby'])
+async def lobby_enqueue(entry: LobbyEntryModel, state: UnoState = Depends(get_state)):
+    ticket = state.lobby.enqueue(entry.display_name, entry.table_size, entry.rule_set.value)
+
+    payload = {
+        'success': True,
+        'message': 'Player queued for a table',
+        'ticket': ticket.to_dict(),
+    }
+
+    return payload
+
+
+@router.get('/lobby/ticket/{ticket_id}', tags=['Lobby'])
+async def lobby_ticket(ticket_id: int, wait: float = 0, state: UnoState = Depends(get_state)):
+    '''Long polls for up to `wait` seconds until the ticket has been seated at a table'''
+    try:
+        ticket = await state.lobby.wait_for_match(ticket_id, min(wait, 30))
+    except UnoLobbyTicketNotFound:
+        raise HTTPException(status_code=404, detail=f'Ticket {ticket_id} not found')
+
+    payload = {
+        'success': True,
+        'message': 'Seated at a table' if ticket.matched else 'Waiting for players',
+        'ticket': ticket.to_dict(),
+    }
+
+    return payload
+
+
+@router.delete('/lobby/ticket/{ticket_id}', tags=['Lobby'])
+async def lobby_cancel(ticket_id: int, state: UnoState = Depends(get_state)):
+    try:
+        result = state.lobby.cancel(ticket_id)
+    except UnoLobbyTicketNotFound:
+        raise HTTPException(status_code=404, detail=f'Ticket {ticket_id} not found')
+
+    payload = {
+        'success': result,
+        'message': 'Ticket cancelled' if result else 'Ticket already matched',
+    }
+
+    return payload
+
+
+@router.get('/lobby/stats', tags=['Lobby'])
+async def lobby_stats(state: UnoState = Depends(get_state)):
+    return state.lobby.get_stats()
+
+
+
+# ---------- Analytics ----------
+
+@router.get('/export/history', tags=['Analytics'])
+async def export_history(
+    format: ExportFormat = ExportFormat.NDJSON,
+    since: float | None = None,
+    until: float | None = None,
+    status: GameStatusFilter | None = None,
+    batch_size: int = 1024,
+    state: UnoState = Depends(get_state),
+):
+    game_status = GameStatus[status.upper()] if status else None
+
+    if format == ExportFormat.COLUMNAR:
+        lines = export.iter_columnar_ndjson(state.games, batch_size, since, until, game_status)
+    else:
+        lines = export.iter_ndjson(state.games, since, until, game_status)
+
+    # the generator is consumed in the threadpool, so live games keep being served from the loop
+    return StreamingResponse(lines, media_type='application/x-ndjson')
+
+
+
+@router.get('/leaderboard', tags=['Analytics'])
+async def leaderboard(limit: int = Query(default=10, ge=1, le=500), state: UnoState = Depends(get_state)):
+    '''Players ranked by wins, then by average finishing position'''
+    players = state.leaderboard.top(limit)
+
+    payload = {
+        'success': True,
+        'message': f'top {len(players)} players',
+        'players': players,
+    }
+
+    return payload
+
+
+@router.get('/players/{display_name}/stats', tags=['Analytics'])
+async def player_stats(display_name: str, state: UnoState = Depends(get_state)):
+    stats = state.leaderboard.get_stats(display_name)
+
+    if stats is None:
+        raise HTTPException(status_code=404, detail=f'No games played by {display_name}')
+
+    payload = {
+        'success': True,
+        'message': f'stats for {display_name}',
+        'stats': stats,
+    }
+
+    return payload
+
+
+
 # ---------- Player Interaction ----------
 
-@app.post('/game/{game_id}/player/{player_id}/discard', tags=['Player'])
-def player_command_discard(game_id: int, player_id: int, discard_options: DiscardOption):
-    card_color = Color[discard_options.card.color.upper()] if discard_options.card.color else None
-    card_action = Action[discard_options.card.action.upper()] if discard_options.card.action else None
-    card = Card(card_color, discard_options.card.number, card_action)
+@router.post(
+    '/game/{game_id}/player/{player_id}/discard',
+    tags=['Player'],
+    dependencies=[Depends(admit_command)],
+)
+@idempotent('discard')
+async def player_command_discard(
+    game_id: int,
+    player_id: int,
+    discard_options: DiscardOption,
+    idempotency_key: str | None = Header(default=None),
+    state: UnoState = Depends(get_state),
+):
+    with tracing.span('card'):
+        card_color = Color[discard_options.card.color.upper()] if discard_options.card.color else None
+        card_action = Action[discard_options.card.action.upper()] if discard_options.card.action else None
+        card = Card(card_color, discard_options.card.number, card_action)
 
     command_details = {
         'card': card,
-        'color_chosen': discard_options.color_chosen,
+        'color_chosen': Color[discard_options.color_chosen.upper()] if discard_options.color_chosen else None,
         'say_uno': discard_options.say_uno,
     }
 
-    p = get_player_by_id(player_id)
-    result = p.discard(command_details)
+    result = await state.store.command(game_id, 'discard', player_id, command_details)
 
     payload = {
         'success': result,
@@ -165,10 +491,19 @@ def player_command_discard(game_id: int, player_id: int, discard_options: Discar
     return payload
 
 
-@app.post('/game/{game_id}/player/{player_id}/draw', tags=['Player'])
-def player_command_draw(game_id: int, player_id: int):
-    p = get_player_by_id(player_id)
-    drawn_cards = p.draw()
+@router.post(
+    '/game/{game_id}/player/{player_id}/draw',
+    tags=['Player'],
+    dependencies=[Depends(admit_command)],
+)
+@idempotent('draw')
+async def player_command_draw(
+    game_id: int,
+    player_id: int,
+    idempotency_key: str | None = Header(default=None),
+    state: UnoState = Depends(get_state),
+):
+    drawn_cards = await state.store.command(game_id, 'draw', player_id)
 
     payload = {
         'success': len(drawn_cards) > 0,
@@ -179,10 +514,19 @@ def player_command_draw(game_id: int, player_id: int):
     return payload
 
 
-@app.post('/game/{game_id}/player/{player_id}/keep', tags=['Player'])
-def player_command_keep(game_id: int, player_id: int):
-    p = get_player_by_id(player_id)
-    result = p.keep()
+@router.post(
+    '/game/{game_id}/player/{player_id}/keep',
+    tags=['Player'],
+    dependencies=[Depends(admit_command)],
+)
+@idempotent('keep')
+async def player_command_keep(
+    game_id: int,
+    player_id: int,
+    idempotency_key: str | None = Header(default=None),
+    state: UnoState = Depends(get_state),
+):
+    result = await state.store.command(game_id, 'keep', player_id)
 
     payload = {
         'success': result,
@@ -192,10 +536,19 @@ def player_command_keep(game_id: int, player_id: int):
     return payload
 
 
-@app.post('/game/{game_id}/player/{player_id}/challenge', tags=['Player'])
-def player_command_challenge(game_id: int, player_id: int):
-    p = get_player_by_id(player_id)
-    result = p.challenge()
+@router.post(
+    '/game/{game_id}/player/{player_id}/challenge',
+    tags=['Player'],
+    dependencies=[Depends(admit_command)],
+)
+@idempotent('challenge')
+async def player_command_challenge(
+    game_id: int,
+    player_id: int,
+    idempotency_key: str | None = Header(default=None),
+    state: UnoState = Depends(get_state),
+):
+    result = await state.store.command(game_id, 'challenge', player_id)
 
     payload = {
         'success': result,
@@ -205,10 +558,19 @@ def player_command_challenge(game_id: int, player_id: int):
     return payload
 
 
-@app.post('/game/{game_id}/player/{player_id}/catch', tags=['Player'])
-def player_command_catch(game_id: int, player_id: int):
-    p = get_player_by_id(player_id)
-    result = p.catch()
+@router.post(
+    '/game/{game_id}/player/{player_id}/catch',
+    tags=['Player'],
+    dependencies=[Depends(admit_command)],
+)
+@idempotent('catch')
+async def player_command_catch(
+    game_id: int,
+    player_id: int,
+    idempotency_key: str | None = Header(default=None),
+    state: UnoState = Depends(get_state),
+):
+    result = await state.store.command(game_id, 'catch', player_id)
 
     payload = {
         'success': result,
@@ -218,26 +580,140 @@ def player_command_catch(game_id: int, player_id: int):
     return payload
 
 
-def get_game_by_id(game_id):
-    for g in games:
-        if g.game_id == game_id:
-            return g
-    return False
+@router.get('/traces', tags=['Analytics'])
+async def recent_traces(slow: bool = False, state: UnoState = Depends(get_state)):
+    '''Sampled traces kept in memory, or the traces of the slowest requests'''
+    traces = list(state.tracer.slow_traces) if slow else state.tracer.exporter.get_traces()
 
+    payload = {
+        'success': True,
+        'message': f'{len(traces)} traces',
+        'traces': traces,
+    }
+
+    return payload
 
-def get_player_by_id(player_id):
-    for p in players:
-        if p.player_id == player_id:
-            return p
-    return False
 
+@router.get('/admission/stats', tags=['Game'])
+async def admission_stats(state: UnoState = Depends(get_state)):
+    return state.admission.get_stats()
 
-def get_short_player(player):
-    p = {
-        'display_name': player.display_name,
-        'player_id': player.player_id,
-        'hand': player.hand,
-        'game': player.game_controller.game_id,
+
+@router.get('/persistence/stats', tags=['Game'])
+async def persistence_stats(state: UnoState = Depends(get_state)):
+    return state.persistence.get_stats()
+
+
+@router.get('/timers/stats', tags=['Game'])
+async def timer_stats(state: UnoState = Depends(get_state)):
+    return state.turn_timers.get_stats()
+
+
+@router.get('/game/{game_id}/idempotency', tags=['Player'])
+async def idempotency_stats(game_id: int, state: UnoState = Depends(get_state)):
+    cache = state.response_caches.get(game_id)
+
+    payload = {
+        'success': True,
+        'message': f'idempotency cache stats for game id {game_id}',
+        'stats': (cache or ResponseCache(state.config['idempotency_cache_size'])).get_stats(),
     }
 
-    return p
+    return payload
+
+
+@router.get('/game/{game_id}/player/{player_id}/evaluate', tags=['Player'])
+async def player_evaluate_moves(
+    game_id: int,
+    player_id: int,
+    budget_ms: int = Query(default=100, ge=1, le=2000),
+    state: UnoState = Depends(get_state),
+):
+    '''Win probability of every move open to the current turn player, best first'''
+    try:
+        moves = await state.store.evaluate(game_id, player_id, budget_ms)
+    except UnoInvalidTurnException:
+        raise HTTPException(status_code=409, detail=f'It is not the turn of player {player_id}')
+
+    payload = {
+        'success': True,
+        'message': f'Evaluated {len(moves)} moves',
+        'moves': moves,
+    }
+
+    return payload
+
+
+
+# ---------- Bot protocol ----------
+
+async def require_bot_token(
+    x_bot_token: str | None = Header(default=None),
+    state: UnoState = Depends(get_state),
+):
+    if x_bot_token not in state.bot_tokens:
+        raise HTTPException(status_code=403, detail='Unknown bot token')
+
+
+@router.post(
+    '/bot/game/{game_id}/player/{player_id}/{command}',
+    tags=['Bot'],
+    dependencies=[Depends(require_bot_token), Depends(admit_command)],
+)
+async def bot_command(
+    game_id: int,
+    player_id: int,
+    command: BotCommand,
+    request: Request,
+    state: UnoState = Depends(get_state),
+):
+    '''
+    MessagePack only command endpoint that skips pydantic validation,
+    the body is the array [card_id, color_chosen, say_uno]
+    '''
+    if command == BotCommand.DISCARD:
+        try:
+            args = [wire.decode_bot_command(await request.body())]
+        except UnoInvalidCardException as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    else:
+        args = []
+
+    result = await state.store.command(game_id, command.value, player_id, *args)
+
+    return wire.msgpack_response({'success': bool(result), 'result': result})
+
+
+@router.get('/bot/game/{game_id}/state', tags=['Bot'], dependencies=[Depends(require_bot_token)])
+async def bot_game_state(game_id: int, player_id: int, since: int = 0, state: UnoState = Depends(get_state)):
+    '''
+    Compact view of the game for player_id with the commands after game version
+    `since`, bots send back the returned version to only receive what changed
+    '''
+    view = await state.store.view(game_id, player_id, since)
+
+    events = [
+        [
+            event.get('player_id'),
+            event['action'].lower(),
+            event.get('card'),
+            event.get('challenge_succeeded', event.get('success')),
+        ]
+        for event in view['events'] if event['event'] == 'command'
+    ]
+
+    compact_state = {
+        'version': view['version'],
+        'top': view['top_card'],
+        'color': view['color_in_play'],
+        'turn': view['current_turn_player_id'],
+        'hand': view['hand'],
+        'hand_sizes': view['hand_sizes'],
+        'events': events,
+        'truncated': view['truncated'],
+    }
+
+    return wire.msgpack_response(compact_state)
+
+
+app = create_app()
@@ -0,0 +1,363 @@
+'''Monte Carlo win probability for the moves of the current turn player
+
+The game is encoded as NumPy arrays of card ids (see uno.CARD_TYPES): the
+viewer's hand, the unseen card pool, the top card and the turn order. Unknown
+opponent hands and draw pile orders are sampled from the pool and thousands of
+games are rolled out side by side, one vectorized step per turn, with every
+player playing a random valid card or drawing when they can't. Like the engine,
+a game that runs out of cards shuffles its discard pile back into the draw pile.
+'''
+import time
+
+import numpy as np
+
+from .uno import (
+    Action,
+    CardFactory,
+    CARD_TYPES,
+    Color,
+    TurnDirection,
+    UnoInvalidTurnException,
+    card_from_id,
+    card_to_id,
+    settings,
+)
+
+
+COLORS = [Color.RED, Color.GREEN, Color.BLUE, Color.YELLOW, Color.ANY]
+ANY = COLORS.index(Color.ANY)
+
+NO_ACTION, REVERSE, SKIP, DRAW2, WILD, DRAW4 = range(6)
+ACTIONS = {
+    None: NO_ACTION,
+    Action.REVERSE: REVERSE,
+    Action.SKIP: SKIP,
+    Action.DRAW2: DRAW2,
+    Action.WILD: WILD,
+    Action.DRAW4: DRAW4,
+}
+
+# per card id attributes
+CARD_COLOR = np.array([COLORS.index(color) for color, _, _ in CARD_TYPES], dtype=np.int8)
+CARD_NUMBER = np.array([-1 if number is None else number for _, number, _ in CARD_TYPES], dtype=np.int8)
+CARD_ACTION = np.array([ACTIONS[action] for _, _, action in CARD_TYPES], dtype=np.int8)
+CARD_PENALTY = np.where(CARD_ACTION == DRAW2, 2, np.where(CARD_ACTION == DRAW4, 4, 0)).astype(np.int16)
+
+# (card id, color) one hot, used to pick a color for wild cards
+COLOR_ONEHOT = np.eye(len(COLORS), dtype=np.int16)[CARD_COLOR][:, :ANY]
+
+NUM_CARD_TYPES = len(CARD_TYPES)
+
+DRAW_MOVE = 'draw'
+
+
+def deck_counts(config=None):
+    '''Number of copies of every card id in a full deck'''
+    cf = CardFactory((config or settings)['default_deck'])
+    cf.make_cards()
+
+    counts = np.zeros(NUM_CARD_TYPES, dtype=np.int16)
+    for card in cf.get_cards():
+        counts[card_to_id(card)] += 1
+
+    return counts
+
+
+def cards_to_counts(cards):
+    counts = np.zeros(NUM_CARD_TYPES, dtype=np.int16)
+    for card in cards:
+        counts[card_to_id(card)] += 1
+    return counts
+
+
+def playable_mask(top, color_in_play, draw_stack):
+    '''
+    (rollouts, card ids) mask of the cards that may be placed on `top`, the same
+    rules as GameController.is_valid_card_to_play
+    '''
+
+    tc = CARD_COLOR[top][:, None]
+    tn = CARD_NUMBER[top][:, None]
+    ta = CARD_ACTION[top][:, None]
+    ci = color_in_play[:, None]
+
+    cc = CARD_COLOR[None, :]
+    cn = CARD_NUMBER[None, :]
+    ca = CARD_ACTION[None, :]
+
+    any_color = cc == ANY
+
+    number_rule = (cc == tc) | ((cn == tn) & (cn >= 0)) | any_color
+    skip_reverse_rule = (cc == tc) | (ca == ta) | any_color
+    draw_rule = (cc == tc) | (cc == ci) | any_color | (ca == ta)
+    wild_rule = (cc == ci) | any_color
+
+    valid = np.where(
+        tn >= 0, number_rule,
+        np.where((ta == SKIP) | (ta == REVERSE), skip_reverse_rule,
+                 np.where((ta == DRAW2) | (ta == DRAW4), draw_rule, wild_rule)))
+
+    # with a draw stack pending only the same draw card can be stacked
+    return valid & ~((draw_stack[:, None] > 0) & (ca != ta))
+
+
+class RolloutState:
+    '''A batch of games being played out in parallel'''
+
+    def __init__(self, hands, pile, pile_pos, discarded, top, color_in_play, draw_stack, current, direction, rng):
+        self.hands = hands # (rollouts, players, card ids) counts
+        self.pile = pile # (rollouts, cards) draw pile order, drawn from pile_pos to the end
+        self.pile_pos = pile_pos
+        self.discarded = discarded # (rollouts, card ids) counts of the discard pile under the top card
+        self.top = top
+        self.color_in_play = color_in_play
+        self.draw_stack = draw_stack
+        self.current = current
+        self.direction = direction
+        self.rng = rng
+
+        self.done = np.zeros(len(pile), dtype=bool)
+        self.winner = np.full(len(pile), -1, dtype=np.int16)
+
+    @property
+    def num_players(self):
+        return self.hands.shape[1]
+
+    def reshuffle(self, row):
+        '''Shuffle the discard pile of one game, bar the top card, back into its draw pile'''
+        cards = np.repeat(np.arange(NUM_CARD_TYPES), self.discarded[row])
+        self.rng.shuffle(cards)
+
+        width = self.pile.shape[1]
+        self.pile[row, width - len(cards):] = cards
+        self.pile_pos[row] = width - len(cards)
+        self.discarded[row] = 0
+
+    def draw(self, rows, quantity):
+        '''Move `quantity[i]` cards from the pile into the hand of the current player of rows[i]'''
+        players = self.current[rows]
+        width = self.pile.shape[1]
+
+        for i in range(int(quantity.max(initial=0))):
+            wanted = quantity > i
+
+            for row in rows[wanted & (self.pile_pos[rows] >= width)]:
+                self.reshuffle(row)
+            exhausted = self.pile_pos[rows] >= width
+
+            # games with every card in the players' hands end without a winner
+            self.done[rows[wanted & exhausted]] = True
+
+            take = wanted & ~exhausted
+            r = rows[take]
+            cards = self.pile[r, self.pile_pos[r]]
+            np.add.at(self.hands, (r, players[take], cards), 1)
+            self.pile_pos[r] += 1
+
+    def discard(self, rows, cards):
+        '''The current player of rows[i] discards cards[i], and the turn moves on'''
+        players = self.current[rows]
+        self.hands[rows, players, cards] -= 1
+
+        self.discarded[rows, self.top[rows]] += 1
+        self.top[rows] = cards
+        colors = CARD_COLOR[cards].copy()
+
+        # wild cards take the color the player is holding most of
+        wild = colors == ANY
+        if wild.any():
+            held = (self.hands[rows[wild], players[wild]] @ COLOR_ONEHOT)
+            colors[wild] = held.argmax(axis=1)
+        self.color_in_play[rows] = colors
+
+        penalty = CARD_PENALTY[cards]
+        self.draw_stack[rows] = np.where(penalty > 0, self.draw_stack[rows] + penalty, 0)
+
+        won = self.hands[rows, players].sum(axis=1) == 0
+        self.done[rows[won]] = True
+        self.winner[rows[won]] = players[won]
+
+        actions = CARD_ACTION[cards]
+        reverse = actions == REVERSE
+        self.direction[rows[reverse]] *= -1
+
+        steps = np.where((actions == SKIP) | (reverse & (self.num_players == 2)), 2, 1)
+        self.advance(rows, steps)
+
+    def advance(self, rows, steps):
+        self.current[rows] = (self.current[rows] + self.direction[rows] * steps) % self.num_players
+
+    def step(self):
+        rows = np.nonzero(~self.done)[0]
+        if not len(rows):
+            return False
+
+        hand = self.hands[rows, self.current[rows]]
+        playable = playable_mask(self.top[rows], self.color_in_play[rows], self.draw_stack[rows]) & (hand > 0)
+
+        can_play = playable.any(axis=1)
+
+        # random valid card for everyone who can play
+        choice = (self.rng.random(playable.shape) * playable).argmax(axis=1)
+        self.discard(rows[can_play], choice[can_play])
+
+        # everyone else picks up the draw stack, or a single card, and keeps
+        stuck = rows[~can_play]
+        quantity = np.maximum(self.draw_stack[stuck], 1)
+        self.draw(stuck, quantity)
+        self.draw_stack[stuck] = 0
+        self.advance(stuck, 1)
+
+        return True
+
+
+class MonteCarloEvaluator:
+
+    def __init__(self, rollouts_per_batch=512, first_batch=32, max_turns=400, seed=None):
+        # rollouts per move, batches start small so a short budget still gets results and double each round
+        self.rollouts_per_batch = rollouts_per_batch
+        self.first_batch = first_batch
+        self.max_turns = max_turns
+        self.rng = np.random.default_rng(seed)
+        self.deck = deck_counts()
+        self.deck_size = int(self.deck.sum())
+
+    def encode(self, gc, player):
+        '''Snapshot what `player` can see of the game as arrays'''
+        order = list(gc.turn_tracker.tracked_players)
+        current = gc.turn_tracker.get_current_turn_player()
+
+        if current is not player:
+            raise UnoInvalidTurnException
+
+        hand = cards_to_counts(player.hand)
+
+        # every card on the discard pile is public
+        discarded = cards_to_counts(gc.discard_pile.cards)
+        pool = np.clip(self.deck - hand - discarded, 0, None)
+
+        top = card_to_id(gc.discard_pile.get_last_card())
+        under_top = discarded.copy()
+        under_top[top] -= 1
+
+        return {
+            'viewer': order.index(player),
+            'hand': hand,
+            'hand_sizes': [len(p.hand) for p in order],
+            'pool': np.repeat(np.arange(NUM_CARD_TYPES), pool),
+            'top': top,
+            'discarded': under_top,
+            'color_in_play': COLORS.index(gc.color_in_play) if gc.color_in_play in COLORS else ANY,
+            'draw_stack': gc.draw_stack_quantity,
+            'direction': 1 if gc.turn_tracker.turn_direction == TurnDirection.CLOCKWISE else -1,
+        }
+
+    def sample(self, encoded, n):
+        '''Deal n random worlds consistent with what the viewer knows'''
+        num_players = len(encoded['hand_sizes'])
+        viewer = encoded['viewer']
+        pool = encoded['pool']
+
+        hands = np.zeros((n, num_players, NUM_CARD_TYPES), dtype=np.int16)
+        hands[:, viewer] = encoded['hand']
+
+        shuffled = pool[np.argsort(self.rng.random((n, len(pool))), axis=1)]
+
+        pos = 0
+        rows = np.arange(n)
+        for p, size in enumerate(encoded['hand_sizes']):
+            if p == viewer:
+                continue
+
+            size = min(size, len(pool) - pos)
+            for i in range(pos, pos + size):
+                np.add.at(hands, (rows, p, shuffled[:, i]), 1)
+            pos += size
+
+        # room for a whole deck, a reshuffle can bring back more cards than were dealt to the pile
+        pile = np.zeros((n, self.deck_size), dtype=shuffled.dtype)
+        remaining = shuffled.shape[1] - pos
+        pile[:, self.deck_size - remaining:] = shuffled[:, pos:]
+
+        return RolloutState(
+            hands,
+            pile,
+            np.full(n, self.deck_size - remaining, dtype=np.int32),
+            np.tile(encoded['discarded'], (n, 1)),
+            np.full(n, encoded['top'], dtype=np.int16),
+            np.full(n, encoded['color_in_play'], dtype=np.int8),
+            np.full(n, encoded['draw_stack'], dtype=np.int16),
+            np.full(n, viewer, dtype=np.int16),
+            np.full(n, encoded['direction'], dtype=np.int8),
+            self.rng,
+        )
+
+    def candidate_moves(self, gc, player):
+        moves = {}
+        for card in player.hand:
+            if gc.is_valid_card_to_play(card):
+                moves[card_to_id(card)] = card
+        return list(moves) + [DRAW_MOVE]
+
+    def rollout(self, encoded, moves, n, deadline=None):
+        '''
+        Play every move in n sampled worlds, all in one batch, and return how many
+        the viewer won per move, or None when the deadline passed first
+        '''
+        state = self.sample(encoded, n * len(moves))
+        groups = np.arange(n * len(moves)).reshape(len(moves), n)
+
+        discards = [i for i, move in enumerate(moves) if move != DRAW_MOVE]
+        if discards:
+            rows = groups[discards].ravel()
+            cards = np.repeat([moves[i] for i in discards], n).astype(np.int16)
+            state.discard(rows, cards)
+
+        if DRAW_MOVE in moves:
+            rows = groups[moves.index(DRAW_MOVE)]
+            state.draw(rows, np.full(n, max(encoded['draw_stack'], 1), dtype=np.int16))
+            state.draw_stack[rows] = 0
+            state.advance(rows, 1)
+
+        for _ in range(self.max_turns):
+            if not state.step():
+                break
+            if deadline is not None and time.perf_counter() >= deadline:
+                return None
+
+        return (state.winner[groups] == encoded['viewer']).sum(axis=1)
+
+    def evaluate(self, gc, player, budget_ms=100):
+        '''
+        Estimate the probability of `player` winning after each of their valid moves,
+        rolling out batches of every move together until the time budget runs out.
+        A batch cut short by the deadline is thrown away, so on a very short budget
+        the moves can come back without rollouts or probabilities.
+        '''
+        deadline = time.perf_counter() + budget_ms / 1000
+        encoded = self.encode(gc, player)
+        moves = self.candidate_moves(gc, player)
+
+        wins = np.zeros(len(moves), dtype=np.int64)
+        trials = 0
+        batch = self.first_batch
+
+        while time.perf_counter() < deadline:
+            won = self.rollout(encoded, moves, batch, deadline)
+            if won is None:
+                break
+
+            wins += won
+            trials += batch
+            batch = min(batch * 2, self.rollouts_per_batch)
+
+        results = []
+        for move, won in zip(moves, wins):
+            results.append({
+                'move': 'discard' if move != DRAW_MOVE else DRAW_MOVE,
+                'card': card_from_id(move) if move != DRAW_MOVE else None,
+                'win_probability': int(won) / trials if trials else None,
+                'rollouts': trials,
+            })
+
+        return sorted(results, key=lambda r: -1 if r['win_probability'] is None else r['win_probability'], reverse=True)
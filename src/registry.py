@@ -0,0 +1,151 @@
+'''Registry of all the games on the server
+
+Besides the games by id, the registry keeps secondary indexes by status and by
+number of players. Every index is a sorted list of creation sequence numbers,
+so listings are cursor paginated in creation order straight off the smallest
+matching index, and creation time windows are a bisect on the creation log.
+The indexes follow the games through their event listeners.
+
+Games built in a thread, by provisioning or the lobby, are registered after
+games created in the meantime, so a game's created_at is stamped when it is
+registered. That keeps the creation log sorted by time.
+'''
+from bisect import bisect_left, insort
+import threading
+import time
+
+from .uno import GameStatus
+
+
+class GameRegistry:
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.by_id = {}
+        self.seqs = {} # game_id -> creation sequence number
+        self.created = [] # (created_at, game_id) by sequence number
+
+        self.by_status = {status: [] for status in GameStatus}
+        self.by_player_count = {}
+        self.indexed = {} # game_id -> (status, player count) as currently indexed
+
+        self.lock = threading.Lock()
+
+    def append(self, gc):
+        with self.lock:
+            self.stamp(gc)
+            seq = len(self.created)
+            self.by_id[gc.game_id] = gc
+            self.seqs[gc.game_id] = seq
+            self.created.append((gc.created_at, gc.game_id))
+            self.index(gc)
+
+        gc.event_listeners.append(self.on_game_event)
+
+    def extend(self, games):
+        '''Register a batch of games under a single acquisition of the lock'''
+        with self.lock:
+            for gc in games:
+                self.stamp(gc)
+                self.seqs[gc.game_id] = len(self.created)
+                self.by_id[gc.game_id] = gc
+                self.created.append((gc.created_at, gc.game_id))
+                self.index(gc)
+
+        for gc in games:
+            gc.event_listeners.append(self.on_game_event)
+
+    def stamp(self, gc):
+        '''Set created_at to now, never before the last game registered even if the clock steps back'''
+        now = self.clock()
+        gc.created_at = max(now, self.created[-1][0]) if self.created else now
+
+    def get(self, game_id):
+        return self.by_id.get(game_id, False)
+
+    def __iter__(self):
+        return iter(list(self.by_id.values()))
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def on_game_event(self, gc, event, details):
+        with self.lock:
+            self.index(gc)
+
+    def index(self, gc):
+        '''Move gc to the index buckets matching its current status and player count'''
+        key = (gc.get_status(), len(gc.players))
+        old_key = self.indexed.get(gc.game_id)
+
+        if key == old_key:
+            return
+
+        seq = self.seqs[gc.game_id]
+
+        if old_key:
+            remove_sorted(self.by_status[old_key[0]], seq)
+            remove_sorted(self.by_player_count[old_key[1]], seq)
+
+        insort(self.by_status[key[0]], seq)
+        insort(self.by_player_count.setdefault(key[1], []), seq)
+        self.indexed[gc.game_id] = key
+
+    def list_games(self, status=None, player_count=None, created_after=None, created_before=None,
+                   cursor=None, limit=50):
+        '''
+        Up to limit games matching all the filters, oldest first, starting after the
+        sequence number `cursor`. Returns the games and the cursor of the next page.
+        '''
+        with self.lock:
+            candidates = []
+            if status is not None:
+                candidates.append(self.by_status[status])
+            if player_count is not None:
+                candidates.append(self.by_player_count.get(player_count, []))
+
+            # walk the smallest index, the other filters are checked per game
+            seqs = min(candidates, key=len) if candidates else None
+
+            lo = 0 if cursor is None else cursor + 1
+            hi = len(self.created)
+            if created_after is not None:
+                lo = max(lo, bisect_left(self.created, (created_after,)))
+            if created_before is not None:
+                hi = bisect_left(self.created, (created_before,))
+
+            if seqs is None:
+                seqs = range(lo, hi)
+                start = 0
+            else:
+                start = bisect_left(seqs, lo)
+
+            page = []
+            next_cursor = None
+
+            for i in range(start, len(seqs)):
+                seq = seqs[i]
+                if seq >= hi:
+                    break
+
+                game_id = self.created[seq][1]
+                game_status, game_player_count = self.indexed[game_id]
+
+                if status is not None and game_status != status:
+                    continue
+                if player_count is not None and game_player_count != player_count:
+                    continue
+
+                if len(page) == limit:
+                    next_cursor = page[-1][0]
+                    break
+
+                page.append((seq, self.by_id[game_id]))
+
+        return [gc for _, gc in page], next_cursor
+
+
+def remove_sorted(seqs, seq):
+    i = bisect_left(seqs, seq)
+    if i < len(seqs) and seqs[i] == seq:
+        seqs.pop(i)
@@ -0,0 +1,279 @@
+'''Replay corpus of recorded games
+
+Finished games are appended to a corpus file as fixed size binary records:
+
+    game header   magic, seed, hand size, number of players, number of commands
+    commands      one 8 byte record per command, see COMMAND
+    outcome       player indexes in the order they won (255 pads), then final hand sizes
+
+A game is replayed from its seed and its commands alone, since the seed fixes
+every shuffle. The corpus is read through mmap one game at a time, so
+replaying millions of commands never loads the whole file.
+'''
+from collections import defaultdict
+import asyncio
+import mmap
+import struct
+import threading
+import time
+
+from .uno import (
+    Color, GameController, GameStatus, Player, PlayerCommand, card_from_id, card_to_id, settings,
+)
+
+
+MAGIC = b'UNOG'
+
+# magic, seed, hand size, players, commands
+GAME = struct.Struct('<4sQBBI')
+
+# player index, action, card id, chosen color, flags, result, hand size after, top card id after
+COMMAND = struct.Struct('<8B')
+
+NONE = 255
+COLORS = [None, Color.RED, Color.GREEN, Color.BLUE, Color.YELLOW]
+
+SAY_UNO = 1
+FORCED_DRAW = 2
+
+
+class UnoCorpusFormatError(Exception):
+    pass
+
+
+def card_id_or_none(card):
+    return card_to_id(card) if card else NONE
+
+
+def encode_command(gc, seats, details):
+    player = gc.get_player_by_id(details['player_id'])
+    color_chosen = details.get('color_chosen')
+    top_card = gc.discard_pile.get_last_card() if gc.discard_pile.cards else None
+
+    flags = 0
+    if details.get('say_uno'):
+        flags |= SAY_UNO
+    if details.get('forced_draw'):
+        flags |= FORCED_DRAW
+
+    # challenges and catches are the only commands whose outcome isn't visible in the hands
+    result = details.get('challenge_succeeded', details.get('success'))
+
+    return COMMAND.pack(
+        seats[player.player_id],
+        details['action'].value,
+        card_id_or_none(details.get('card')),
+        COLORS.index(Color[color_chosen.name]) if color_chosen else 0,
+        flags,
+        int(bool(result)),
+        min(len(player.hand), 254),
+        card_id_or_none(top_card),
+    )
+
+
+def encode_outcome(gc, seats):
+    num_players = len(gc.players)
+    winners = [seats[p.player_id] for p in gc.winners]
+    winners += [NONE] * (num_players - len(winners))
+    hand_sizes = [min(len(p.hand), 254) for p in gc.players]
+
+    return bytes(winners + hand_sizes)
+
+
+class GameRecording:
+    '''Collects the commands of one game from its events'''
+
+    def __init__(self, gc, on_finished):
+        self.gc = gc
+        self.on_finished = on_finished
+        self.seats = {}
+        self.commands = []
+        self.finished = False
+
+    def on_game_event(self, gc, event, details):
+        if event == 'game_started':
+            self.seats = {p.player_id: idx for idx, p in enumerate(gc.players)}
+        elif event == 'command' and self.seats and not self.finished:
+            self.commands.append(encode_command(gc, self.seats, details))
+
+            if gc.get_status() == GameStatus.FINISHED:
+                self.finished = True
+                self.on_finished(self)
+
+    def to_bytes(self):
+        gc = self.gc
+        header = GAME.pack(MAGIC, gc.seed, gc.starting_hand_qty, len(gc.players), len(self.commands))
+        return header + b''.join(self.commands) + encode_outcome(gc, self.seats)
+
+
+class CorpusRecorder:
+    '''
+    Appends every watched game to the corpus at path once it finishes. Finished
+    games are only buffered when they end, run() writes them out from a thread
+    every flush_interval seconds so the event loop never waits on the disk.
+    '''
+
+    def __init__(self, path, flush_interval=1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.games_written = 0
+
+    def watch(self, gc):
+        recording = GameRecording(gc, self.write)
+        gc.event_listeners.append(recording.on_game_event)
+
+    def write(self, recording):
+        data = recording.to_bytes()
+        with self.lock:
+            self.pending.append(data)
+
+    def flush(self):
+        '''Append the buffered games to the corpus, blocking'''
+        with self.flush_lock:
+            with self.lock:
+                pending, self.pending = self.pending, []
+
+            if pending:
+                with open(self.path, 'ab') as f:
+                    f.write(b''.join(pending))
+                self.games_written += len(pending)
+
+    async def run(self):
+        try:
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                if self.pending:
+                    await asyncio.to_thread(self.flush)
+        finally:
+            # games finished since the last flush are written out on shutdown
+            await asyncio.to_thread(self.flush)
+
+
+class RecordedGame:
+    '''
+    One game of a corpus. The commands are a view into the mapped file, only
+    valid while iter_corpus is on this game.
+    '''
+
+    def __init__(self, seed, hand_size, num_players, commands, winners, hand_sizes):
+        self.seed = seed
+        self.hand_size = hand_size
+        self.num_players = num_players
+        self.commands = commands
+        self.winners = winners
+        self.hand_sizes = hand_sizes
+
+    def iter_commands(self):
+        return COMMAND.iter_unpack(self.commands)
+
+
+def iter_corpus(path):
+    with open(path, 'rb') as f:
+        if not f.seek(0, 2):
+            return
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            offset = 0
+
+            try:
+                while offset < len(mm):
+                    magic, seed, hand_size, num_players, num_commands = GAME.unpack_from(mm, offset)
+                    if magic != MAGIC:
+                        raise UnoCorpusFormatError(f'no game record at offset {offset}')
+
+                    offset += GAME.size
+                    commands = view[offset:offset + num_commands * COMMAND.size]
+                    offset += num_commands * COMMAND.size
+
+                    winners = [idx for idx in mm[offset:offset + num_players] if idx != NONE]
+                    hand_sizes = list(mm[offset + num_players:offset + 2 * num_players])
+                    offset += 2 * num_players
+
+                    try:
+                        yield RecordedGame(seed, hand_size, num_players, commands, winners, hand_sizes)
+                    finally:
+                        commands.release()
+            finally:
+                view.release()
+
+
+def decode_command(players, record):
+    player_idx, action, card_id, color, flags, _, _, _ = record
+    details = {'action': PlayerCommand(action)}
+
+    if card_id != NONE:
+        details['card'] = card_from_id(card_id)
+    if color:
+        details['color_chosen'] = COLORS[color]
+    if flags & SAY_UNO:
+        details['say_uno'] = True
+    if flags & FORCED_DRAW:
+        details['forced_draw'] = True
+
+    return players[player_idx].player_id, details
+
+
+def replay_game(game, timings):
+    '''
+    Replay game and describe how it diverged from the recording, stopping at
+    the first command that did. timings maps command names to [count, seconds] and is added to.
+    '''
+    rules = {**settings, 'default_hand_size': game.hand_size}
+    gc = GameController(rules, seed=game.seed)
+
+    players = [Player(f'player {idx}') for idx in range(game.num_players)]
+    for p in players:
+        p.join_game(gc)
+    gc.start()
+
+    seats = {p.player_id: idx for idx, p in enumerate(players)}
+    mismatches = []
+
+    for seq, record in enumerate(game.iter_commands()):
+        player_id, details = decode_command(players, record)
+
+        started = time.perf_counter()
+        try:
+            gc.process_player_command(player_id, details)
+        except Exception as e:
+            mismatches.append(f'command {seq} {details["action"].name} raised {type(e).__name__}')
+            return mismatches
+        elapsed = time.perf_counter() - started
+
+        timing = timings[details['action'].name]
+        timing[0] += 1
+        timing[1] += elapsed
+
+        replayed = COMMAND.unpack(encode_command(gc, seats, details))
+        if replayed != record:
+            mismatches.append(f'command {seq} {details["action"].name} recorded {record} replayed {replayed}')
+            return mismatches
+
+    winners = [players.index(p) for p in gc.winners]
+    hand_sizes = [min(len(p.hand), 254) for p in players]
+
+    if winners != game.winners:
+        mismatches.append(f'winners recorded {game.winners} replayed {winners}')
+    if hand_sizes != game.hand_sizes:
+        mismatches.append(f'hand sizes recorded {game.hand_sizes} replayed {hand_sizes}')
+
+    return mismatches
+
+
+def replay_corpus(path):
+    '''Replay every game of the corpus, returns (games, {game index: mismatches}, timings)'''
+    timings = defaultdict(lambda: [0, 0.0])
+    failures = {}
+    games = 0
+
+    for idx, game in enumerate(iter_corpus(path)):
+        mismatches = replay_game(game, timings)
+        if mismatches:
+            failures[idx] = mismatches
+        games += 1
+
+    return games, failures, timings
@@ -0,0 +1,371 @@
+'''Sharded multi-process game engine
+
+Games are partitioned across a pool of engine worker processes by game_id.
+Every worker owns its games and their players outright, so each game keeps a
+single writer, while games on different shards are played on different cores.
+API handlers forward calls to the owning worker over a pipe and await the
+result on the event loop; ids are handed out by the parent so they are unique
+across shards. Rule sets are passed by name and looked up in the worker.
+
+The parent reads and writes the pipes with asyncio streams rather than from
+threads. A duplex multiprocessing Pipe is a Unix socket pair, and the parent
+speaks its framing: a 4 byte signed big endian length, then the pickled
+message. Workers answer in the order they were asked, so every shard keeps the
+futures of its calls in flight in a FIFO that a reader task resolves.
+'''
+from bisect import bisect_right
+from collections import deque
+import asyncio
+import itertools
+import multiprocessing
+import pickle
+import socket
+import struct
+
+from .registry import GameRegistry
+from .uno import (
+    GameController, Player, UnoGameNotFoundException, UnoPlayerNotFoundException,
+    get_game_summary, get_short_game_state, rule_sets,
+)
+from .views import ViewStore
+
+
+# message framing of multiprocessing.Connection, lengths past 2 ** 31 - 1 are sent as -1 then 8 bytes
+HEADER = struct.Struct('!i')
+LONG_HEADER = struct.Struct('!Q')
+
+
+class UnoShardPoolClosed(Exception):
+    pass
+
+
+class EngineShard:
+    '''The games of one worker process, and the operations the API can run on them'''
+
+    def __init__(self, rule_set='default'):
+        self.rules = rule_sets[rule_set]
+        self.games = {}
+        self.players = {}
+        self.views = ViewStore()
+        self.evaluator = None
+
+        # the parent hands out game ids in order and a shard receives its calls in
+        # the order they were sent, so game_ids follows registry creation order
+        self.registry = GameRegistry()
+        self.game_ids = []
+
+    def watch_game(self, gc):
+        '''Hook up a new game before anyone joins it'''
+        self.views.watch(gc)
+
+    def add_games(self, games):
+        for gc in games:
+            self.games[gc.game_id] = gc
+            self.game_ids.append(gc.game_id)
+
+        self.registry.extend(games)
+
+    def get_game(self, game_id):
+        gc = self.games.get(game_id)
+
+        if gc is None:
+            raise UnoGameNotFoundException
+
+        return gc
+
+    def new_game(self, game_id):
+        gc = GameController(self.rules)
+        gc.game_id = game_id
+        self.watch_game(gc)
+        self.add_games([gc])
+        return game_id
+
+    def list_games(self, status, player_count, created_after, created_before, cursor, limit):
+        '''
+        Summaries of the first limit games after game id cursor matching the
+        filters, and whether there are more
+        '''
+        seq = None
+        if cursor is not None:
+            # the registry pages by creation sequence number, the last game at or before the cursor
+            seq = bisect_right(self.game_ids, cursor) - 1
+            seq = seq if seq >= 0 else None
+
+        page, next_cursor = self.registry.list_games(
+            status, player_count, created_after, created_before, seq, limit,
+        )
+
+        return [get_game_summary(gc) for gc in page], next_cursor is not None
+
+    def new_player(self, game_id, player_id, display_name):
+        self.get_game(game_id)
+        return self.add_player(player_id, display_name)
+
+    def add_player(self, player_id, display_name):
+        p = Player(display_name)
+        p.player_id = player_id
+        self.players[player_id] = p
+        return player_id
+
+    def join(self, game_id, player_id):
+        gc = self.get_game(game_id)
+        p = self.players.get(player_id)
+
+        if p is None:
+            raise UnoPlayerNotFoundException
+
+        p.join_game(gc)
+        return True
+
+    def start(self, game_id):
+        self.get_game(game_id).start()
+        return True
+
+    def provision(self, tables, rule_set=None):
+        '''
+        tables are (game_id, [(player_id, display_name), ...]) with ids from the parent,
+        played by the named rule set or the shard's own
+        '''
+        rules = rule_sets[rule_set] if rule_set else self.rules
+        games = []
+
+        # as uno.provision_games, but with every id in place before the game is watched and its players seated
+        for game_id, seats in tables:
+            gc = GameController(rules)
+            gc.game_id = game_id
+            self.watch_game(gc)
+
+            for player_id, display_name in seats:
+                self.add_player(player_id, display_name)
+                self.players[player_id].join_game(gc)
+
+            gc.start()
+            games.append(gc)
+
+        self.add_games(games)
+        return True
+
+    def state(self, game_id):
+        return get_short_game_state(self.get_game(game_id))
+
+    def view(self, game_id, player_id, since):
+        return self.views.get_view(self.get_game(game_id), player_id, since)
+
+    def command(self, game_id, op, player_id, *args):
+        '''op is one of discard, draw, keep, challenge or catch'''
+        p = self.players.get(player_id)
+
+        if p is None or p.game_controller is None or p.game_controller.game_id != game_id:
+            raise UnoPlayerNotFoundException
+
+        return getattr(p, op)(*args)
+
+    def evaluate(self, game_id, player_id, budget_ms):
+        '''Holds up the other games of the shard for up to budget_ms'''
+        if self.evaluator is None:
+            from .montecarlo import MonteCarloEvaluator
+            self.evaluator = MonteCarloEvaluator()
+
+        gc = self.get_game(game_id)
+        return self.evaluator.evaluate(gc, gc.get_player_by_id(player_id), budget_ms)
+
+
+def engine_worker(conn, rule_set):
+    shard = EngineShard(rule_set)
+
+    while True:
+        try:
+            op, args = conn.recv()
+        except EOFError:
+            break
+
+        if op is None:
+            break
+
+        try:
+            conn.send((True, getattr(shard, op)(*args)))
+        except Exception as e:
+            conn.send((False, e))
+
+
+def frame(message):
+    data = pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+    return HEADER.pack(len(data)) + data
+
+
+class ShardPool:
+    '''Engine workers driven from the event loop, start() and close() run in the app lifespan'''
+
+    def __init__(self, num_shards, rule_set='default'):
+        self.num_shards = num_shards
+        # rule set of the games created one at a time
+        self.rule_set = rule_set
+        # only used from the event loop, an id is taken and its call sent without yielding
+        self.game_ids = itertools.count(1)
+        self.player_ids = itertools.count(1)
+        self.seats = {} # player_id -> game_id, for the players seated at a game
+
+        self.processes = []
+        self.writers = []
+        self.pending = [] # per shard, futures of the calls in flight in the order they were sent
+        self.readers = []
+
+    async def start(self):
+        # spawn rather than fork, the server process is running threads
+        ctx = multiprocessing.get_context('spawn')
+
+        for shard in range(self.num_shards):
+            parent_conn, child_conn = ctx.Pipe()
+            process = ctx.Process(target=engine_worker, args=(child_conn, self.rule_set), daemon=True)
+            process.start()
+            child_conn.close()
+
+            sock = socket.fromfd(parent_conn.fileno(), socket.AF_UNIX, socket.SOCK_STREAM)
+            parent_conn.close()
+            reader, writer = await asyncio.open_unix_connection(sock=sock)
+
+            self.processes.append(process)
+            self.writers.append(writer)
+            self.pending.append(deque())
+            self.readers.append(asyncio.create_task(self.read_replies(shard, reader)))
+
+    async def close(self):
+        for writer in self.writers:
+            writer.write(frame((None, None)))
+            writer.close()
+
+        for process in self.processes:
+            await asyncio.to_thread(process.join, 5)
+
+        for task in self.readers:
+            task.cancel()
+        await asyncio.gather(*self.readers, return_exceptions=True)
+
+        self.processes, self.writers, self.pending, self.readers = [], [], [], []
+
+    async def read_replies(self, shard, reader):
+        pending = self.pending[shard]
+
+        try:
+            while True:
+                size, = HEADER.unpack(await reader.readexactly(HEADER.size))
+                if size == -1:
+                    size, = LONG_HEADER.unpack(await reader.readexactly(LONG_HEADER.size))
+                ok, result = pickle.loads(await reader.readexactly(size))
+
+                future = pending.popleft()
+                if future.cancelled():
+                    continue
+
+                if ok:
+                    future.set_result(result)
+                else:
+                    future.set_exception(result)
+        except asyncio.IncompleteReadError:
+            # worker gone
+            pass
+        finally:
+            while pending:
+                future = pending.popleft()
+                if not future.done():
+                    future.set_exception(UnoShardPoolClosed())
+
+    def shard_of(self, game_id):
+        return game_id % self.num_shards
+
+    def send(self, shard, op, *args):
+        '''Write the call without yielding to the loop, returns the future of its result'''
+        if not self.writers:
+            raise UnoShardPoolClosed
+
+        future = asyncio.get_running_loop().create_future()
+        self.writers[shard].write(frame((op, args)))
+        self.pending[shard].append(future)
+        return future
+
+    async def call(self, shard, op, *args):
+        # workers run in parallel with each other, and answer their own calls in order
+        future = self.send(shard, op, *args)
+        await self.writers[shard].drain()
+        return await future
+
+    def player_in_game(self, game_id, player_id):
+        return self.seats.get(player_id) == game_id
+
+    # ---------- routed operations ----------
+
+    async def new_game(self):
+        # consecutive game ids spread games evenly over the shards
+        game_id = next(self.game_ids)
+        return await self.call(self.shard_of(game_id), 'new_game', game_id)
+
+    async def list_games(self, status, player_count, created_after, created_before, cursor, limit):
+        '''
+        Games in game_id order, which is creation order. The cursor is the game_id
+        the previous page ended with. Returns (game summaries, next cursor).
+        '''
+        pages = await asyncio.gather(*[
+            self.call(shard, 'list_games', status, player_count, created_after, created_before, cursor, limit)
+            for shard in range(self.num_shards)
+        ])
+
+        # every shard sent its first limit games, so the first limit overall are among them
+        games = sorted((g for page, _ in pages for g in page), key=lambda g: g['game_id'])
+        more = len(games) > limit or any(more for _, more in pages)
+        games = games[:limit]
+
+        return games, games[-1]['game_id'] if more and games else None
+
+    async def new_player(self, game_id, display_name):
+        '''Players live on the shard of the game they are created for'''
+        player_id = next(self.player_ids)
+        return await self.call(self.shard_of(game_id), 'new_player', game_id, player_id, display_name)
+
+    async def join(self, game_id, player_id):
+        result = await self.call(self.shard_of(game_id), 'join', game_id, player_id)
+        self.seats[player_id] = game_id
+        return result
+
+    async def start_game(self, game_id):
+        return await self.call(self.shard_of(game_id), 'start', game_id)
+
+    async def provision(self, tables, rule_set=None):
+        '''
+        Create, seat and start a game per table of display names with one call
+        per shard. Returns [(game_id, [player_id, ...]), ...] in table order.
+        '''
+        by_shard = {}
+        provisioned = []
+
+        for display_names in tables:
+            game_id = next(self.game_ids)
+            seats = [(next(self.player_ids), name) for name in display_names]
+
+            by_shard.setdefault(self.shard_of(game_id), []).append((game_id, seats))
+            provisioned.append((game_id, [player_id for player_id, _ in seats]))
+
+        # sent right after the ids were taken, so game ids stay in order on each shard
+        futures = [
+            self.send(shard, 'provision', shard_tables, rule_set)
+            for shard, shard_tables in by_shard.items()
+        ]
+        for shard in by_shard:
+            await self.writers[shard].drain()
+        await asyncio.gather(*futures)
+
+        for game_id, player_ids in provisioned:
+            self.seats.update((player_id, game_id) for player_id in player_ids)
+
+        return provisioned
+
+    async def state(self, game_id):
+        return await self.call(self.shard_of(game_id), 'state', game_id)
+
+    async def view(self, game_id, player_id, since=None):
+        return await self.call(self.shard_of(game_id), 'view', game_id, player_id, since)
+
+    async def command(self, game_id, op, player_id, *args):
+        return await self.call(self.shard_of(game_id), 'command', game_id, op, player_id, *args)
+
+    async def evaluate(self, game_id, player_id, budget_ms):
+        return await self.call(self.shard_of(game_id), 'evaluate', game_id, player_id, budget_ms)
@@ -0,0 +1,148 @@
+'''Per app state and configuration
+
+Everything an app instance serves from lives on a UnoState, so apps built by
+create_app with different configurations don't share any games, players or
+caches. Anything that is expensive to build is only built on first use.
+'''
+from collections import OrderedDict
+import os
+
+from .admission import AdmissionController
+from .idempotency import ResponseCache
+from .lobby import Lobby
+from .registry import GameRegistry
+from .replay import CorpusRecorder
+from .shards import ShardPool
+from .stats import Leaderboard
+from .store import LocalGameStore, PersistenceQueue, ShardedGameStore
+from .timers import TurnTimers, draw_and_keep
+from .tracing import tracer_from_config
+from .uno import rule_sets
+from .views import ViewStore
+
+
+def default_config():
+    '''Configuration taken from the environment, see the README'''
+    slow_ms = os.environ.get('UNO_TRACE_SLOW_MS', '200')
+
+    return {
+        'rule_set': os.environ.get('UNO_RULE_SET', 'default'),
+        # in-process store, or a pool of engine worker processes when > 0
+        'engine_shards': int(os.environ.get('UNO_ENGINE_SHARDS', 0)),
+        'turn_timeout': float(os.environ.get('UNO_TURN_TIMEOUT', 60)),
+        # action(gc, player) played for a timed out turn, only set through create_app
+        'turn_timeout_action': draw_and_keep,
+        'bot_tokens': [t for t in os.environ.get('UNO_BOT_TOKENS', '').split(',') if t],
+        'idempotency_cache_size': int(os.environ.get('UNO_IDEMPOTENCY_CACHE_SIZE', 256)),
+        'idempotency_cache_games': int(os.environ.get('UNO_IDEMPOTENCY_CACHE_GAMES', 10000)),
+        'lobby_tables_per_batch': int(os.environ.get('UNO_LOBBY_TABLES_PER_BATCH', 500)),
+        'lobby_ticket_ttl': float(os.environ.get('UNO_LOBBY_TICKET_TTL', 300)),
+        'max_in_flight_commands': int(os.environ.get('UNO_MAX_IN_FLIGHT_COMMANDS', 64)),
+        'game_queue_size': int(os.environ.get('UNO_GAME_QUEUE_SIZE', 8)),
+        # see tracing.py
+        'trace_file': os.environ.get('UNO_TRACE_FILE'),
+        'trace_sample_rate': float(os.environ.get('UNO_TRACE_SAMPLE_RATE', 0.01)),
+        # None, or an empty UNO_TRACE_SLOW_MS, turns the slow log off
+        'trace_slow_ms': float(slow_ms) if slow_ms else None,
+        # finished games are appended to this replay corpus when set
+        'replay_corpus': os.environ.get('UNO_REPLAY_CORPUS'),
+    }
+
+
+class UnoState:
+
+    def __init__(self, config=None):
+        self.config = {**default_config(), **(config or {})}
+
+        self.rules = rule_sets[self.config['rule_set']]
+        self.games = GameRegistry()
+        self.players = {} # player_id -> Player
+
+        # game_id -> ResponseCache, least recently used first; finished games stop
+        # being used and are the first to go when there are too many
+        self.response_caches = OrderedDict()
+        self.views = ViewStore()
+
+        # bounds player commands per game and over all games, see admission.py
+        self.admission = AdmissionController(
+            max_in_flight=self.config['max_in_flight_commands'],
+            max_queue_per_game=self.config['game_queue_size'],
+        )
+
+        # tokens of the bot clients allowed to use the unvalidated msgpack fast path
+        self.bot_tokens = set(self.config['bot_tokens'])
+
+        engine_shards = self.config['engine_shards']
+        self.shard_pool = ShardPool(engine_shards, self.config['rule_set']) if engine_shards else None
+
+        replay_corpus = self.config['replay_corpus']
+        self.recorder = CorpusRecorder(replay_corpus) if replay_corpus else None
+
+        # cross game player statistics, fed by the events of in-process games
+        self.leaderboard = Leaderboard()
+
+        # async hooks that game events are handed to, see store.py
+        self.persistence = PersistenceQueue()
+
+        # games played in this process, all of them unless there are engine shards
+        self.local_store = LocalGameStore(self)
+        self.store = ShardedGameStore(self.shard_pool) if self.shard_pool else self.local_store
+
+        # matched tables are provisioned through the store, on the shards when there are any
+        self.lobby = Lobby(
+            self.store.provision,
+            max_tables_per_batch=self.config['lobby_tables_per_batch'],
+            ticket_ttl=self.config['lobby_ticket_ttl'],
+        )
+
+        # seconds a player gets to move before the timeout action, a draw and keep by
+        # default, is played for them under their game's lock, 0 disables; only games
+        # in this process are timed
+        self.turn_timers = TurnTimers(
+            timeout=self.config['turn_timeout'],
+            auto_action=self.config['turn_timeout_action'],
+            store=self.local_store,
+        )
+
+        # requests of this app are traced here, see tracing.py
+        self.tracer = tracer_from_config(self.config)
+
+        self.evaluator = None
+
+    def watch_game(self, gc):
+        '''Hook up a new in-process game before anyone joins it'''
+        self.turn_timers.watch(gc)
+
+        if self.recorder:
+            self.recorder.watch(gc)
+
+        self.leaderboard.watch(gc)
+        self.views.watch(gc)
+        gc.event_listeners.append(self.persistence.submit)
+
+    def get_evaluator(self):
+        # numpy and the rollout tables are only loaded once someone asks for an evaluation
+        if self.evaluator is None:
+            from .montecarlo import MonteCarloEvaluator
+            self.evaluator = MonteCarloEvaluator()
+
+        return self.evaluator
+
+    def get_response_cache(self, game_id):
+        cache = self.response_caches.get(game_id)
+
+        if cache is None:
+            cache = self.response_caches[game_id] = ResponseCache(self.config['idempotency_cache_size'])
+
+            while len(self.response_caches) > self.config['idempotency_cache_games']:
+                self.response_caches.popitem(last=False)
+        else:
+            self.response_caches.move_to_end(game_id)
+
+        return cache
+
+    def get_game_by_id(self, game_id):
+        return self.games.get(game_id)
+
+    def get_player_by_id(self, player_id):
+        return self.players.get(player_id, False)
@@ -0,0 +1,236 @@
+'''Player statistics and leaderboard
+
+Statistics are aggregated across games per display name, the only identity a
+player keeps from one game to the next. They are updated from the engine events
+as they happen, never by scanning games or histories. The leaderboard is an
+indexable skip list ordered by wins and then average finishing position, so
+re-ranking a player and looking up their rank are O(log n) and the top k are
+the first k nodes.
+'''
+import math
+import random
+import threading
+
+from .uno import PlayerCommand
+
+
+class SkipNode:
+
+    def __init__(self, key, level):
+        self.key = key
+        self.next = [None] * level
+        # number of positions each link skips over
+        self.width = [1] * level
+
+
+class SkipList:
+    '''Sorted unique keys with O(log n) insert, remove and rank'''
+
+    max_level = 24
+
+    def __init__(self, seed=None):
+        self.head = SkipNode(None, self.max_level)
+        self.size = 0
+        self.rng = random.Random(seed)
+
+    def random_level(self):
+        level = 1
+        while level < self.max_level and self.rng.random() < 0.5:
+            level += 1
+        return level
+
+    def find_chain(self, key):
+        '''The last node before key on every level, and its position'''
+        chain = [None] * self.max_level
+        positions = [0] * self.max_level
+        node = self.head
+        position = 0
+
+        for level in reversed(range(self.max_level)):
+            while node.next[level] is not None and node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+            positions[level] = position
+
+        return chain, positions
+
+    def insert(self, key):
+        chain, positions = self.find_chain(key)
+        level = self.random_level()
+        node = SkipNode(key, level)
+
+        for i in range(level):
+            prev = chain[i]
+            skipped = positions[0] - positions[i]
+
+            node.next[i] = prev.next[i]
+            node.width[i] = prev.width[i] - skipped if prev.next[i] is not None else 1
+            prev.next[i] = node
+            prev.width[i] = skipped + 1
+
+        for i in range(level, self.max_level):
+            if chain[i].next[i] is not None:
+                chain[i].width[i] += 1
+
+        self.size += 1
+
+    def remove(self, key):
+        chain, _ = self.find_chain(key)
+        node = chain[0].next[0]
+
+        if node is None or node.key != key:
+            raise KeyError(key)
+
+        for i in range(len(node.next)):
+            prev = chain[i]
+            prev.width[i] += node.width[i] - 1
+            prev.next[i] = node.next[i]
+
+        for i in range(len(node.next), self.max_level):
+            if chain[i].next[i] is not None:
+                chain[i].width[i] -= 1
+
+        self.size -= 1
+
+    def rank(self, key):
+        '''0 based position of key'''
+        chain, positions = self.find_chain(key)
+        node = chain[0].next[0]
+
+        if node is None or node.key != key:
+            raise KeyError(key)
+
+        return positions[0]
+
+    def first(self, k):
+        node = self.head.next[0]
+        keys = []
+
+        while node is not None and len(keys) < k:
+            keys.append(node.key)
+            node = node.next[0]
+
+        return keys
+
+    def __len__(self):
+        return self.size
+
+
+class PlayerStats:
+
+    def __init__(self, display_name):
+        self.display_name = display_name
+        self.games = 0
+        self.wins = 0
+        self.finishes = 0
+        self.position_total = 0
+        self.cards_played = 0
+        self.draws = 0
+        self.challenges = 0
+        self.challenges_won = 0
+        self.catches = 0
+        self.catches_won = 0
+
+    def average_position(self):
+        return self.position_total / self.finishes if self.finishes else None
+
+    def ranking_key(self):
+        # most wins first, then best average position, players who never finished last
+        average = self.average_position()
+        return (-self.wins, math.inf if average is None else average, self.display_name)
+
+    def to_dict(self):
+        return {
+            'display_name': self.display_name,
+            'games': self.games,
+            'wins': self.wins,
+            'average_position': self.average_position(),
+            'cards_played': self.cards_played,
+            'draws': self.draws,
+            'challenges': self.challenges,
+            'challenges_won': self.challenges_won,
+            'catches': self.catches,
+            'catches_won': self.catches_won,
+        }
+
+
+class Leaderboard:
+
+    def __init__(self):
+        self.players = {} # display_name -> PlayerStats
+        self.ranking = SkipList()
+
+        # events arrive from the event loop and from provisioning and lobby threads
+        self.lock = threading.Lock()
+
+    def watch(self, gc):
+        gc.event_listeners.append(self.on_game_event)
+
+    def get_player(self, display_name):
+        stats = self.players.get(display_name)
+
+        if stats is None:
+            stats = self.players[display_name] = PlayerStats(display_name)
+            self.ranking.insert(stats.ranking_key())
+
+        return stats
+
+    def on_game_event(self, gc, event, details):
+        with self.lock:
+            if event == 'game_started':
+                for p in gc.players:
+                    self.get_player(p.display_name).games += 1
+
+            elif event == 'command':
+                self.on_command(gc, details)
+
+            elif event == 'player_won':
+                self.finish(gc.get_player_by_id(details['player_id']), details['position'])
+
+                # the last player left holding cards finishes last
+                if len(gc.turn_tracker.tracked_players) == 1:
+                    self.finish(gc.turn_tracker.tracked_players[0], len(gc.players))
+
+    def on_command(self, gc, details):
+        stats = self.get_player(gc.get_player_by_id(details['player_id']).display_name)
+        action = details['action']
+
+        if action == PlayerCommand.DISCARD:
+            stats.cards_played += 1
+        elif action == PlayerCommand.DRAW:
+            stats.draws += 1
+        elif action == PlayerCommand.CHALLENGE:
+            stats.challenges += 1
+            stats.challenges_won += bool(details.get('challenge_succeeded'))
+        elif action == PlayerCommand.CATCH:
+            stats.catches += 1
+            stats.catches_won += bool(details.get('success'))
+
+    def finish(self, player, position):
+        '''Record a finishing position, the only change that moves a player on the leaderboard'''
+        stats = self.get_player(player.display_name)
+        self.ranking.remove(stats.ranking_key())
+
+        stats.finishes += 1
+        stats.position_total += position
+        if position == 1:
+            stats.wins += 1
+
+        self.ranking.insert(stats.ranking_key())
+
+    def top(self, k):
+        with self.lock:
+            return [
+                {'rank': rank, **self.players[key[2]].to_dict()}
+                for rank, key in enumerate(self.ranking.first(k), 1)
+            ]
+
+    def get_stats(self, display_name):
+        '''Stats and leaderboard rank of display_name, or None for an unknown player'''
+        with self.lock:
+            stats = self.players.get(display_name)
+            if stats is None:
+                return None
+
+            return {'rank': self.ranking.rank(stats.ranking_key()) + 1, **stats.to_dict()}
@@ -0,0 +1,289 @@
+'''Async game store
+
+The API talks to games only through a GameStore, whose operations are all
+coroutines. Both stores raise UnoGameNotFoundException for an unknown game and
+UnoPlayerNotFoundException for a player who isn't at it, the app answers both
+with a 404. The local store plays games in this process: an engine call takes
+microseconds, so it runs right on the event loop under the game's asyncio lock
+instead of taking a threadpool slot, and only CPU heavy work such as move
+evaluation or bulk provisioning is sent to a thread. The sharded store forwards
+to the engine worker processes and awaits their answers on the event loop.
+
+Game events can be persisted through async hooks. Events are queued from the
+engine without waiting and handed to the hooks by a background task, so slow
+storage never holds up a command.
+'''
+import abc
+import asyncio
+import logging
+
+from .uno import (
+    GameController, Player, UnoGameNotFoundException, UnoPlayerNotFoundException,
+    get_game_summary, get_short_game_state, provision_games, rule_sets,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+class GameStore(abc.ABC):
+    '''The operations the API runs on games'''
+
+    @abc.abstractmethod
+    async def new_game(self):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def list_games(self, status, player_count, created_after, created_before, cursor, limit):
+        '''Returns (game summaries, next cursor)'''
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def new_player(self, game_id, display_name):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def join(self, game_id, player_id):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def start(self, game_id):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def provision(self, tables, rule_set=None):
+        '''
+        Games played by the named rule set, or the app's when None.
+        Returns [(game_id, [player_id, ...]), ...] in table order.
+        '''
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def state(self, game_id):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def view(self, game_id, player_id, since):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def player_in_game(self, game_id, player_id):
+        '''Whether player_id is seated at game_id, checked before a command is admitted so it never waits'''
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def command(self, game_id, op, player_id, *args):
+        '''
+        op is one of discard, draw, keep, challenge or catch. Raises
+        UnoPlayerNotFoundException if the player isn't seated at the game.
+        '''
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def evaluate(self, game_id, player_id, budget_ms):
+        raise NotImplementedError
+
+
+class LocalGameStore(GameStore):
+
+    def __init__(self, uno_state):
+        self.uno_state = uno_state
+        self.locks = {} # game_id -> asyncio.Lock
+
+    def lock(self, game_id):
+        lock = self.locks.get(game_id)
+
+        if lock is None:
+            lock = self.locks[game_id] = asyncio.Lock()
+
+        return lock
+
+    def get_game(self, game_id):
+        gc = self.uno_state.get_game_by_id(game_id)
+
+        if not gc:
+            raise UnoGameNotFoundException
+
+        return gc
+
+    def get_player(self, player_id):
+        p = self.uno_state.get_player_by_id(player_id)
+
+        if not p:
+            raise UnoPlayerNotFoundException
+
+        return p
+
+    async def new_game(self):
+        gc = GameController(self.uno_state.rules)
+        self.uno_state.watch_game(gc)
+        self.uno_state.games.append(gc)
+        return gc.game_id
+
+    async def list_games(self, status, player_count, created_after, created_before, cursor, limit):
+        page, next_cursor = self.uno_state.games.list_games(
+            status, player_count, created_after, created_before, cursor, limit,
+        )
+
+        return [get_game_summary(g) for g in page], next_cursor
+
+    async def new_player(self, game_id, display_name):
+        self.get_game(game_id)
+        p = Player(display_name)
+        self.uno_state.players[p.player_id] = p
+        return p.player_id
+
+    async def join(self, game_id, player_id):
+        async with self.lock(game_id):
+            gc = self.get_game(game_id)
+            self.get_player(player_id).join_game(gc)
+        return True
+
+    async def start(self, game_id):
+        async with self.lock(game_id):
+            self.get_game(game_id).start()
+        return True
+
+    async def provision(self, tables, rule_set=None):
+        rules = rule_sets[rule_set] if rule_set else self.uno_state.rules
+
+        # hundreds of tables are too much work to do on the event loop
+        games = await asyncio.to_thread(provision_games, tables, rules, self.uno_state.watch_game)
+
+        for gc in games:
+            self.uno_state.players.update((p.player_id, p) for p in gc.players)
+        self.uno_state.games.extend(games)
+
+        return [(gc.game_id, [p.player_id for p in gc.players]) for gc in games]
+
+    async def state(self, game_id):
+        return get_short_game_state(self.get_game(game_id))
+
+    async def view(self, game_id, player_id, since):
+        return self.uno_state.views.get_view(self.get_game(game_id), player_id, since)
+
+    def player_in_game(self, game_id, player_id):
+        p = self.uno_state.players.get(player_id)
+        return p is not None and p.game_controller is not None and p.game_controller.game_id == game_id
+
+    async def command(self, game_id, op, player_id, *args):
+        async with self.lock(game_id):
+            if not self.player_in_game(game_id, player_id):
+                raise UnoPlayerNotFoundException
+
+            return getattr(self.uno_state.players[player_id], op)(*args)
+
+    async def evaluate(self, game_id, player_id, budget_ms):
+        g = self.get_game(game_id)
+        p = g.get_player_by_id(player_id)
+        evaluator = self.uno_state.get_evaluator()
+
+        # commands wait while the rollouts read the game
+        async with self.lock(game_id):
+            return await asyncio.to_thread(evaluator.evaluate, g, p, budget_ms)
+
+
+class ShardedGameStore(GameStore):
+    '''
+    Forwards to a ShardPool, whose calls are awaited on the event loop without
+    taking a thread; the workers already run the commands of a game one at a time.
+    '''
+
+    def __init__(self, shard_pool):
+        self.shard_pool = shard_pool
+
+    async def new_game(self):
+        return await self.shard_pool.new_game()
+
+    async def list_games(self, status, player_count, created_after, created_before, cursor, limit):
+        return await self.shard_pool.list_games(
+            status, player_count, created_after, created_before, cursor, limit,
+        )
+
+    async def new_player(self, game_id, display_name):
+        return await self.shard_pool.new_player(game_id, display_name)
+
+    async def join(self, game_id, player_id):
+        return await self.shard_pool.join(game_id, player_id)
+
+    async def start(self, game_id):
+        return await self.shard_pool.start_game(game_id)
+
+    async def provision(self, tables, rule_set=None):
+        return await self.shard_pool.provision(tables, rule_set)
+
+    async def state(self, game_id):
+        return await self.shard_pool.state(game_id)
+
+    async def view(self, game_id, player_id, since):
+        return await self.shard_pool.view(game_id, player_id, since)
+
+    def player_in_game(self, game_id, player_id):
+        return self.shard_pool.player_in_game(game_id, player_id)
+
+    async def command(self, game_id, op, player_id, *args):
+        return await self.shard_pool.command(game_id, op, player_id, *args)
+
+    async def evaluate(self, game_id, player_id, budget_ms):
+        return await self.shard_pool.evaluate(game_id, player_id, budget_ms)
+
+
+class PersistenceQueue:
+    '''
+    Hands game events to async persistence hooks, called as
+    await hook(game_id, event, details). Events past max_pending are dropped
+    and counted rather than slowing the engine down.
+    '''
+
+    def __init__(self, max_pending=10000):
+        self.max_pending = max_pending
+        self.hooks = []
+
+        # made by run() on the serving loop
+        self.loop = None
+        self.queue = None
+
+        self.persisted = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def submit(self, gc, event, details):
+        '''Game event listener, may be called from any thread'''
+        if not self.hooks or self.loop is None:
+            return
+
+        self.loop.call_soon_threadsafe(self.enqueue, (gc.game_id, event, dict(details)))
+
+    def enqueue(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(self.max_pending)
+
+        while True:
+            item = await self.queue.get()
+
+            for hook in self.hooks:
+                try:
+                    await hook(*item)
+                except Exception:
+                    self.failed += 1
+                    logger.exception('persistence hook failed')
+
+            self.persisted += 1
+
+    def get_stats(self):
+        return {
+            'hooks': len(self.hooks),
+            'pending': self.queue.qsize() if self.queue else 0,
+            'persisted': self.persisted,
+            'dropped': self.dropped,
+            'failed': self.failed,
+        }
@@ -0,0 +1,185 @@
+'''Turn timeouts
+
+Every game gets a deadline armed on a hashed timer wheel whenever its turn
+moves on. Arming and cancelling a deadline is O(1) and each tick of the wheel
+only looks at the timers in a single slot, so thousands of games cost nothing
+per tick until their turns actually expire. The wheel is driven by a task on
+the event loop, no threads per game. An expired turn is played as a `time_out`
+command through the game store, queued behind the player commands of its game,
+which runs the timers' auto_action on the game: a forced draw and keep unless
+another is configured.
+'''
+import asyncio
+import functools
+import itertools
+import logging
+import math
+import threading
+import time
+
+from .uno import GameStatus, PlayerCommand
+
+
+logger = logging.getLogger(__name__)
+
+
+class Timer:
+
+    def __init__(self, timer_id, slot, rounds, callback):
+        self.timer_id = timer_id
+        self.slot = slot
+        self.rounds = rounds # full turns of the wheel left before expiry
+        self.callback = callback
+
+
+class TimerWheel:
+
+    def __init__(self, tick=0.1, num_slots=512):
+        self.tick = tick
+        self.slots = [{} for _ in range(num_slots)]
+        self.current_tick = 0
+        self.ids = itertools.count()
+
+        # timers are armed by game events, on the event loop or in a provisioning thread, and expired on the loop
+        self.lock = threading.Lock()
+
+    def schedule(self, delay, callback):
+        ticks = max(1, math.ceil(delay / self.tick))
+
+        with self.lock:
+            target = self.current_tick + ticks
+            slot = target % len(self.slots)
+            rounds = (ticks - 1) // len(self.slots)
+
+            timer = Timer(next(self.ids), slot, rounds, callback)
+            self.slots[slot][timer.timer_id] = timer
+
+        return timer
+
+    def cancel(self, timer):
+        with self.lock:
+            return self.slots[timer.slot].pop(timer.timer_id, None) is not None
+
+    def advance(self):
+        '''Move the wheel on by one tick and return the callbacks of the expired timers'''
+        expired = []
+
+        with self.lock:
+            self.current_tick += 1
+            slot = self.slots[self.current_tick % len(self.slots)]
+
+            for timer in list(slot.values()):
+                if timer.rounds > 0:
+                    timer.rounds -= 1
+                else:
+                    expired.append(slot.pop(timer.timer_id).callback)
+
+        return expired
+
+    async def run(self):
+        '''Tick in real time, catching up on ticks missed while the loop was busy'''
+        started = time.monotonic()
+
+        while True:
+            await asyncio.sleep(self.tick)
+
+            due = int((time.monotonic() - started) / self.tick)
+            while self.current_tick < due:
+                for callback in self.advance():
+                    try:
+                        callback()
+                    except Exception:
+                        logger.exception('timer callback failed')
+
+    def __len__(self):
+        return sum(len(slot) for slot in self.slots)
+
+
+def in_play(gc):
+    return gc.get_status() == GameStatus.IN_PROGRESS and len(gc.turn_tracker.tracked_players) > 1
+
+
+def draw_and_keep(gc, player):
+    '''Default timeout action: a forced draw, then the turn ends'''
+    gc.process_player_command(player.player_id, {'action': PlayerCommand.DRAW, 'forced_draw': True})
+
+    # drawing a pending draw stack already passes the turn on
+    if gc.turn_tracker.get_current_turn_player() is player:
+        gc.process_player_command(player.player_id, {'action': PlayerCommand.END_TURN})
+
+
+class TurnTimers:
+
+    def __init__(self, timeout=60, auto_action=draw_and_keep, store=None, wheel=None):
+        self.timeout = timeout
+        # auto_action(gc, player) plays the timed out turn
+        self.auto_action = auto_action
+        # timed out turns are played through the store, or straight on the game without one
+        self.store = store
+        self.wheel = wheel if wheel is not None else TimerWheel()
+
+        self.deadlines = {} # game_id -> (turn token, Timer)
+        self.running = set() # time_out commands waiting for their game
+        self.expired = 0
+
+    def watch(self, gc):
+        '''Time every turn of gc from now on'''
+        if self.timeout:
+            gc.turn_tracker.turn_listeners.append(functools.partial(self.arm, gc))
+            gc.event_listeners.append(self.on_game_event)
+
+    def disarm(self, gc):
+        deadline = self.deadlines.pop(gc.game_id, None)
+        if deadline:
+            self.wheel.cancel(deadline[1])
+
+    def arm(self, gc, player):
+        self.disarm(gc)
+
+        if in_play(gc):
+            token = object()
+            timer = self.wheel.schedule(self.timeout, functools.partial(self.expire, gc, player, token))
+            self.deadlines[gc.game_id] = (token, timer)
+
+    def on_game_event(self, gc, event, details):
+        # the winning discard arms the next turn before the winner leaves the game
+        if event == 'player_won' and not in_play(gc):
+            self.disarm(gc)
+
+    def expire(self, gc, player, token):
+        deadline = self.deadlines.get(gc.game_id)
+
+        # the turn moved on in the meantime
+        if not deadline or deadline[0] is not token:
+            return
+
+        self.deadlines.pop(gc.game_id)
+
+        if not in_play(gc) or gc.turn_tracker.get_current_turn_player() is not player:
+            return
+
+        self.expired += 1
+
+        if self.store is None:
+            player.time_out(self.auto_action)
+            return
+
+        task = asyncio.get_running_loop().create_task(self.time_out(gc, player))
+        self.running.add(task)
+        task.add_done_callback(self.running.discard)
+
+    async def time_out(self, gc, player):
+        try:
+            await self.store.command(gc.game_id, 'time_out', player.player_id, self.auto_action)
+        except Exception:
+            logger.exception('timed out turn of game %s failed', gc.game_id)
+
+    async def run(self):
+        await self.wheel.run()
+
+    def get_stats(self):
+        return {
+            'timeout': self.timeout,
+            'armed': len(self.deadlines),
+            'expired': self.expired,
+        }
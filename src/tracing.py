@@ -0,0 +1,250 @@
+'''Request scoped tracing
+
+Spans nest through a context variable, so a span opened in the engine while a
+request is being handled becomes a child of that request's span, threadpool
+hops included. Every request builds its whole span tree, a few small objects,
+so a slow request always has its full tree in the slow log. Whether a trace is
+sampled is decided when its root span opens, and only decides whether the
+tree is exported when the root ends. The file exporter buffers its traces and
+writes them out from a thread.
+
+Every app has its own Tracer. The app sets it as the tracer of the request in a
+context variable, which is what the module level span() and tag() record to;
+outside of a request they do nothing.
+'''
+from collections import deque
+from contextlib import contextmanager
+import asyncio
+import contextvars
+import functools
+import inspect
+import itertools
+import json
+import logging
+import random
+import threading
+import time
+
+
+slow_logger = logging.getLogger('uno.slow')
+
+current_span = contextvars.ContextVar('current_span', default=None)
+current_tracer = contextvars.ContextVar('current_tracer', default=None)
+
+
+class Span:
+
+    ids = itertools.count(1)
+
+    def __init__(self, name, parent, tags, sampled=True):
+        self.name = name
+        self.span_id = next(self.ids)
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else self.span_id
+        self.tags = tags
+        self.children = []
+        self.sampled = sampled
+
+        self.start = time.time()
+        self.started = time.perf_counter()
+        self.duration_ms = None
+
+    def tag(self, **tags):
+        self.tags.update(tags)
+
+    def finish(self):
+        self.duration_ms = (time.perf_counter() - self.started) * 1000
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'start': self.start,
+            'duration_ms': self.duration_ms,
+            'tags': self.tags,
+            'children': [child.to_dict() for child in list(self.children)],
+        }
+
+
+class NoopSpan:
+    '''Stands in for spans opened outside of a request'''
+
+    def tag(self, **tags):
+        pass
+
+
+NOOP_SPAN = NoopSpan()
+
+
+class InMemoryExporter:
+
+    def __init__(self, max_traces=1000):
+        self.traces = deque(maxlen=max_traces)
+
+    def export(self, trace):
+        self.traces.append(trace)
+
+    def get_traces(self):
+        return list(self.traces)
+
+
+class FileExporter:
+    '''
+    Appends one JSON trace tree per line. Traces are buffered and run() writes
+    them out from a thread every flush_interval seconds, and on shutdown.
+    '''
+
+    def __init__(self, path, flush_interval=1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+
+    def export(self, trace):
+        line = json.dumps(trace, default=str) + '\n'
+        with self.lock:
+            self.pending.append(line)
+
+    def flush(self):
+        '''Append the buffered traces to the file, blocking'''
+        with self.flush_lock:
+            with self.lock:
+                pending, self.pending = self.pending, []
+
+            if pending:
+                with open(self.path, 'a') as f:
+                    f.write(''.join(pending))
+
+    async def run(self):
+        try:
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                if self.pending:
+                    await asyncio.to_thread(self.flush)
+        finally:
+            await asyncio.to_thread(self.flush)
+
+    def get_traces(self):
+        return []
+
+
+class Tracer:
+
+    def __init__(self, exporter=None, sample_rate=1.0, slow_threshold_ms=None, max_slow_traces=100):
+        self.exporter = exporter or InMemoryExporter()
+        self.sample_rate = sample_rate
+        self.slow_threshold_ms = slow_threshold_ms
+        self.slow_traces = deque(maxlen=max_slow_traces)
+
+    @contextmanager
+    def span(self, name, **tags):
+        parent = current_span.get()
+
+        if parent is None:
+            # the sample rate only picks the traces that are exported
+            span = Span(name, None, tags, sampled=random.random() < self.sample_rate)
+        else:
+            span = Span(name, parent, tags)
+            parent.children.append(span)
+
+        token = current_span.set(span)
+        try:
+            yield span
+        except Exception as e:
+            span.tag(error=type(e).__name__)
+            raise
+        finally:
+            span.finish()
+            current_span.reset(token)
+
+            if parent is None:
+                self.end_trace(span)
+
+    def end_trace(self, root):
+        slow = self.slow_threshold_ms is not None and root.duration_ms >= self.slow_threshold_ms
+
+        if not (root.sampled or slow):
+            return
+
+        trace = root.to_dict()
+
+        if root.sampled:
+            self.exporter.export(trace)
+
+        if slow:
+            self.slow_traces.append(trace)
+            slow_logger.warning(json.dumps(trace, default=str))
+
+    def tag(self, **tags):
+        '''Add tags to the innermost open span'''
+        span = current_span.get()
+        if span:
+            span.tag(**tags)
+
+
+@contextmanager
+def span(name, **tags):
+    '''A span of the trace of the current request, if any'''
+    tracer = current_tracer.get()
+
+    if tracer is None:
+        yield NOOP_SPAN
+        return
+
+    with tracer.span(name, **tags) as opened:
+        yield opened
+
+
+def tag(**tags):
+    tracer = current_tracer.get()
+    if tracer is not None:
+        tracer.tag(**tags)
+
+
+@contextmanager
+def request_trace(tracer, name, **tags):
+    '''Root span of a request, with tracer as the tracer for everything in it'''
+    token = current_tracer.set(tracer)
+    try:
+        with tracer.span(name, **tags) as root:
+            yield root
+    finally:
+        current_tracer.reset(token)
+
+
+def traced_endpoint(endpoint):
+    '''Wrap an API endpoint in a `handler` span tagged with its game and player ids'''
+    if getattr(endpoint, 'traced', False):
+        # routes are rebuilt when a router is included into an app
+        return endpoint
+
+    def handler_span(kwargs):
+        tags = {k: kwargs[k] for k in ('game_id', 'player_id') if k in kwargs}
+        return span('handler', endpoint=endpoint.__name__, **tags)
+
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            with handler_span(kwargs):
+                return await endpoint(*args, **kwargs)
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            with handler_span(kwargs):
+                return endpoint(*args, **kwargs)
+
+    wrapper.traced = True
+    return wrapper
+
+
+def tracer_from_config(config):
+    '''The tracer of an app, see the trace_ settings of state.default_config()'''
+    path = config['trace_file']
+
+    return Tracer(
+        exporter=FileExporter(path) if path else InMemoryExporter(),
+        sample_rate=config['trace_sample_rate'],
+        slow_threshold_ms=config['trace_slow_ms'],
+    )
@@ -1,5 +1,8 @@
 from enum import Enum
 import random
+import time
+
+from . import tracing
 
 
 class Color(Enum):
@@ -31,6 +34,12 @@ class TurnDirection(Enum):
     COUNTER_CLOCKWISE = 2
 
 
+class GameStatus(Enum):
+    WAITING = 'WAITING'
+    IN_PROGRESS = 'IN_PROGRESS'
+    FINISHED = 'FINISHED'
+
+
 settings = {
     'deck_size': 1,
     'default_deck': [
@@ -56,6 +65,12 @@ settings = {
     'default_hand_size': 7,
 }
 
+# rule sets a game can be created with, keyed by name
+rule_sets = {
+    'default': settings,
+    'quick': {**settings, 'default_hand_size': 5},
+}
+
 
 class UnoOutOfCardsError(Exception):
     pass
@@ -69,6 +84,9 @@ class UnoInvalidCardPlayed(Exception):
 class UnoPlayerNotFoundException(Exception):
     pass
 
+class UnoGameNotFoundException(Exception):
+    pass
+
 class UnoInvalidCardException(Exception):
     pass
 
@@ -105,10 +123,40 @@ class Card:
             return f'{self.color.value}_{self.action.value}'
 
 
+# every distinct card face gets a small integer id, used by compact encodings
+CARD_TYPES = [
+    *[(color, number, None)
+      for color in [Color.RED, Color.GREEN, Color.BLUE, Color.YELLOW]
+      for number in range(10)],
+    *[(color, None, action)
+      for color in [Color.RED, Color.GREEN, Color.BLUE, Color.YELLOW]
+      for action in [Action.SKIP, Action.REVERSE, Action.DRAW2]],
+    (Color.ANY, None, Action.WILD),
+    (Color.ANY, None, Action.DRAW4),
+]
+CARD_IDS = {face: card_id for card_id, face in enumerate(CARD_TYPES)}
+
+
+def card_to_id(card):
+    try:
+        return CARD_IDS[(card.color, card.number, card.action)]
+    except KeyError:
+        raise UnoInvalidCardException(f'{card} is not a valid card')
+
+
+def card_from_id(card_id):
+    # bools are ints and negative ids would index CARD_TYPES from the end
+    if type(card_id) is not int or not 0 <= card_id < len(CARD_TYPES):
+        raise UnoInvalidCardException(f'{card_id!r} is not a valid card id')
+
+    return Card(*CARD_TYPES[card_id])
+
+
 class Deck:
 
-    def __init__(self, num=1, ordered=True):
+    def __init__(self, num=1, ordered=True, config=None):
         # TODO: implement number of decks - with many players 2 decks would be needed to play etc
+        self.config = config or settings['default_deck']
         self.cards = self.add_cards_to_deck()
 
         if not ordered:
@@ -116,13 +164,11 @@ class Deck:
 
 
     def add_cards_to_deck(self):
-        cf = CardFactory(settings['default_deck'])
-        cf.make_cards()
-        return cf.get_cards()
+        return list(get_deck_template(self.config))
 
 
-    def shuffle(self):
-        random.shuffle(self.cards)
+    def shuffle(self, rng=random):
+        rng.shuffle(self.cards)
         return self.cards
 
 
@@ -167,6 +213,26 @@ class CardFactory:
         return self.cards
 
 
+# deck config id -> (deck config, cards)
+deck_templates = {}
+
+
+def get_deck_template(deck_config):
+    '''
+    The cards of a deck, made the first time a deck config is used. Cards are
+    never modified once made so every game's deck shares the same card objects.
+    '''
+    template = deck_templates.get(id(deck_config))
+
+    if template is None:
+        cf = CardFactory(deck_config)
+        cf.make_cards()
+        # the config is kept alongside so its id can't be reused while cached
+        template = deck_templates.setdefault(id(deck_config), (deck_config, tuple(cf.get_cards())))
+
+    return template[1]
+
+
 class DrawPile:
 
     cards = []
@@ -187,6 +253,17 @@ class DrawPile:
                 'Draw pile empty, add more cards'
             )
 
+    def draw_many(self, quantity):
+        '''Take quantity cards off the top in one go'''
+        if quantity > len(self.cards):
+            raise UnoOutOfCardsError(
+                'Draw pile empty, add more cards'
+            )
+
+        cards = self.cards[:quantity]
+        del self.cards[:quantity]
+        return cards
+
     def add_card(self, card):
         '''If draw pile is depleted use cards from discard pile'''
         self.cards.append(card)
@@ -203,6 +280,7 @@ class DiscardPile:
 
 
     def  __init__(self, card=None):
+        self.cards = []
         if card:
             self.cards.append(card)
 
@@ -215,15 +293,15 @@ class DiscardPile:
     def clear_discard_pile(self, clear_all=False):
         '''Empties and returns all but the 'top' card'''
         if clear_all:
-            cards = self.cards
+            cards = list(self.cards)
             self.cards.clear()
             return cards
         else:
             cards = self.cards[:-1]
-            last_but_one = self.cards[:-1]
+            top_card = self.cards[-1]
 
             self.cards.clear()
-            self.cards.append(last_but_one)
+            self.cards.append(top_card)
 
             return cards
 
@@ -238,10 +316,7 @@ class Player:
 
     def draw(self):
         command_details = {'action': PlayerCommand.DRAW}
-        drawn_cards = self.game_controller.process_player_command(self.player_id, command_details)
-        self.hand.extend(drawn_cards)
-
-        return drawn_cards
+        return self.game_controller.process_player_command(self.player_id, command_details)
 
 
     def discard(self, command_details):
@@ -274,6 +349,19 @@ class Player:
         result = self.game_controller.process_player_command(self.player_id, command_details)
         return result
 
+    def time_out(self, action):
+        '''
+        Played for a player whose turn ran out, as action(game_controller, player).
+        Does nothing when the game is over or it isn't their turn anymore.
+        '''
+        gc = self.game_controller
+
+        if gc.get_status() != GameStatus.IN_PROGRESS or gc.turn_tracker.get_current_turn_player() is not self:
+            return False
+
+        action(gc, self)
+        return True
+
     def join_game(self, game_controller):
         self.game_controller = game_controller
         self.game_controller.add_player(self)
@@ -319,6 +407,9 @@ class TurnTracker:
         self.current_turn_player = None
         self.previous_turn_player = None
 
+        # called with the new current turn player every time the turn moves on
+        self.turn_listeners = []
+
     def get_current_turn_player(self):
         if not self.tracked_players:
             # No players to track, raise exception
@@ -365,6 +456,12 @@ class TurnTracker:
         self.previous_turn_player = self.tracked_players[current_turn_player_index]
         self.current_turn_player = self.tracked_players[next_turn_player_index]
 
+        self.notify_turn_listeners()
+
+    def notify_turn_listeners(self):
+        for listener in self.turn_listeners:
+            listener(self.current_turn_player)
+
 
     def toggle_turn_direction(self):
         if self.turn_direction == TurnDirection.CLOCKWISE:
@@ -420,14 +517,23 @@ class GameController:
     color_in_play = None
     winners = []
 
-    def __init__(self, settings):
+    def __init__(self, settings, seed=None):
         self.settings = settings
 
+        # every shuffle of the game comes from its own generator, so a game is
+        # replayed exactly from its seed and its commands
+        self.seed = seed if seed is not None else random.randrange(2 ** 64)
+        self.rng = random.Random(self.seed)
+
+        # per game state, the class level defaults would be shared by every game
+        self.players = []
+        self.winners = []
+
         self.starting_hand_qty = self.settings['default_hand_size']
 
         # create a new deck of cards
         self.make_game_deck()
-        self.deck.shuffle()
+        self.deck.shuffle(self.rng)
 
         # populate draw pile
         self.draw_pile = DrawPile(self.deck.cards)
@@ -441,28 +547,60 @@ class GameController:
 
         self.history = []
 
+        # called as listener(game_controller, event, details) on every game event
+        self.event_listeners = []
+        self.version = 0 # bumped on every event
+
         self.game_id = id(self)
+        self.created_at = time.time()
+        self.started = False
 
     def add_player(self, player):
         self.turn_tracker.start_tracking_player(player)
-        return self.players.append(player)
+        self.players.append(player)
+        self.emit('player_joined', {'player_id': player.player_id})
+
+    def emit(self, event, details):
+        self.version += 1
+        for listener in self.event_listeners:
+            listener(self, event, details)
+
+    def add_history(self, command_details):
+        self.history.append(command_details)
+        self.emit('command', command_details)
 
 
     def make_game_deck(self):
         deck_size = self.settings['deck_size']
-        self.deck = Deck(num=deck_size)
+        self.deck = Deck(num=deck_size, config=self.settings['default_deck'])
 
     def start(self):
         self.deal_starting_hand()
         self.start_discard_pile()
+        self.started = True
+        self.emit('game_started', {})
+
+        # the first turn starts now
+        self.turn_tracker.notify_turn_listeners()
+
+    def get_status(self):
+        if not self.started:
+            return GameStatus.WAITING
+
+        # the game is over once at most one player is left holding cards
+        if len(self.turn_tracker.tracked_players) <= 1:
+            return GameStatus.FINISHED
+
+        return GameStatus.IN_PROGRESS
 
 
     def deal_starting_hand(self):
+        '''Deal round robin from a single slice off the top of the draw pile'''
+        num_players = len(self.players)
+        dealt = self.draw_pile.draw_many(self.starting_hand_qty * num_players)
 
-        for _ in range(self.starting_hand_qty):
-            for player in self.players:
-                card = self.draw_pile.drawOne()
-                player.add_card_to_hand(card)
+        for idx, player in enumerate(self.players):
+            player.add_cards_to_hand(dealt[idx::num_players])
 
     def start_discard_pile(self):
 
@@ -476,6 +614,15 @@ class GameController:
 
 
     def process_player_command(self, player_id, command_details):
+        command = command_details.get('action')
+
+        with tracing.span('engine.command', game_id=self.game_id, command=command.name if command else None) as span:
+            result = self.run_player_command(player_id, command_details)
+            span.tag(hand_sizes=[len(p.hand) for p in self.players])
+
+        return result
+
+    def run_player_command(self, player_id, command_details):
         player = self.get_player_by_id(player_id)
         current_turn_player = self.turn_tracker.get_current_turn_player()
         command = command_details.get('action')
@@ -518,10 +665,12 @@ class GameController:
                 if len(player.hand) == 0:
                     self.winners.append(player)
                     self.turn_tracker.stop_tracking_player(player)
+                    self.emit('player_won', {'player_id': player_id, 'position': len(self.winners)})
 
             # Add history detail
             command_details['player_id'] = player_id
-            self.history.append(command_details)
+            command_details['timestamp'] = time.time()
+            self.add_history(command_details)
 
             return True
 
@@ -532,31 +681,21 @@ class GameController:
 
             if self.draw_stack_quantity > 0:
                 for i in range(self.draw_stack_quantity):
-                    try:
-                        drawn_cards.append(self.draw_pile.drawOne())
-                    except UnoOutOfCardsError:
-                        discarded_cards = self.discard_pile.clear_discard_pile()
-                        random.shuffle(discarded_cards)
-                        self.draw_pile.add_cards(discarded_cards)
-                        drawn_cards.append(self.draw_pile.drawOne())
+                    drawn_cards.append(self.draw_card())
 
                 # reset draw stack quantity
                 self.refresh_draw_stack_quantity()
                 self.turn_tracker.calculate_next_turn_player()
             else:
-                try:
-                    dc = self.draw_pile.drawOne()
-                    drawn_cards.append(dc)
-                except UnoOutOfCardsError:
-                    discarded_cards = self.discard_pile.clear_discard_pile()
-                    random.shuffle(discarded_cards)
-                    self.draw_pile.add_cards(discarded_cards)
-                    dc = self.draw_pile.drawOne()
-                    drawn_cards.append(dc)
+                dc = self.draw_card()
+                drawn_cards.append(dc)
 
+            # the cards are in hand before anyone hears about the draw
+            player.add_cards_to_hand(drawn_cards)
 
             command_details['player_id'] = player_id
-            self.history.append(command_details)
+            command_details['timestamp'] = time.time()
+            self.add_history(command_details)
 
             return drawn_cards
 
@@ -582,23 +721,11 @@ class GameController:
 
             if challenge_succeeded:
                 for _ in range(challenge_success_penalty):
-                    try:
-                        penalty_cards.append(self.draw_pile.drawOne())
-                    except UnoOutOfCardsError:
-                        discarded_cards = self.discard_pile.clear_discard_pile()
-                        random.shuffle(discarded_cards)
-                        self.draw_pile.add_cards(discarded_cards)
-                        penalty_cards.append(self.draw_pile.drawOne())
+                    penalty_cards.append(self.draw_card())
                 previous_turn_player.add_cards_to_hand(penalty_cards)
             else:
                 for _ in range(challenge_failure_penalty):
-                    try:
-                        penalty_cards.append(self.draw_pile.drawOne())
-                    except UnoOutOfCardsError:
-                        discarded_cards = self.discard_pile.clear_discard_pile()
-                        random.shuffle(discarded_cards)
-                        self.draw_pile.add_cards(discarded_cards)
-                        penalty_cards.append(self.draw_pile.drawOne())
+                    penalty_cards.append(self.draw_card())
                 current_turn_player.add_cards_to_hand(penalty_cards)
                 self.turn_tracker.calculate_next_turn_player()
 
@@ -606,8 +733,9 @@ class GameController:
             self.refresh_draw_stack_quantity()
 
             command_details['player_id'] = player_id
+            command_details['timestamp'] = time.time()
             command_details['challenge_succeeded'] = challenge_succeeded
-            self.history.append(command_details)
+            self.add_history(command_details)
             return challenge_succeeded
 
 
@@ -627,27 +755,37 @@ class GameController:
 
 
                 for _ in range(uno_penalty):
-                    try:
-                        penalty_cards.append(self.draw_pile.drawOne())
-                    except UnoOutOfCardsError:
-                        discarded_cards = self.discard_pile.clear_discard_pile()
-                        random.shuffle(discarded_cards)
-                        self.draw_pile.add_cards(discarded_cards)
-                        penalty_cards.append(self.draw_pile.drawOne())
+                    penalty_cards.append(self.draw_card())
 
             command_details['player_id'] = player_id
+            command_details['timestamp'] = time.time()
             command_details['success'] = success
-            self.history.append(command_details)
 
             previous_turn_player.add_cards_to_hand(penalty_cards)
+            self.add_history(command_details)
 
             return success
 
         if command == PlayerCommand.END_TURN:
             self.turn_tracker.calculate_next_turn_player()
+            command_details['player_id'] = player_id
+            self.emit('command', command_details)
             return True
 
 
+    def draw_card(self):
+        '''Draw one card, reshuffling the discard pile into the draw pile when it runs out'''
+        try:
+            return self.draw_pile.drawOne()
+        except UnoOutOfCardsError:
+            with tracing.span('engine.reshuffle', game_id=self.game_id) as span:
+                discarded_cards = self.discard_pile.clear_discard_pile()
+                self.rng.shuffle(discarded_cards)
+                self.draw_pile.add_cards(discarded_cards)
+                span.tag(cards=len(discarded_cards))
+
+            return self.draw_pile.drawOne()
+
     def get_player_by_id(self, player_id):
         player = [p for p in self.players if p.player_id == player_id]
 
@@ -756,7 +894,7 @@ class GameController:
 
     def get_game_state(self):
         game_state = {
-            'last_played_card': self.discard_pile.get_last_card(),
+            'last_played_card': self.discard_pile.get_last_card() if self.discard_pile.cards else None,
             'current_turn_player': self.turn_tracker.get_current_turn_player(),
             'turn_direction': self.turn_tracker.turn_direction,
             'color_in_play': self.color_in_play,
@@ -769,6 +907,68 @@ class GameController:
         return game_state
 
 
+def provision_games(tables, settings=settings, on_new_game=None):
+    '''
+    Create, seat and start a game for every table, a table being the display
+    names of its players in seating order. on_new_game(gc) is called before
+    anyone is seated. Returns the started games.
+    '''
+    games = []
+
+    for display_names in tables:
+        gc = GameController(settings)
+        if on_new_game:
+            on_new_game(gc)
+
+        for display_name in display_names:
+            Player(display_name).join_game(gc)
+
+        gc.start()
+        games.append(gc)
+
+    return games
+
+
+def get_short_player(player):
+    '''Public view of a player, hands are only shown to their owner through the views'''
+    p = {
+        'display_name': player.display_name,
+        'player_id': player.player_id,
+        'hand_size': len(player.hand),
+        'game': player.game_controller.game_id,
+    }
+
+    return p
+
+
+def get_short_game_state(gc):
+    '''Game state with players reduced to plain dicts'''
+    gs = gc.get_game_state()
+
+    if gs.get('current_turn_player'):
+        gs['current_turn_player'] = get_short_player(gs['current_turn_player'])
+
+    if gs.get('players_all'):
+        players = [get_short_player(p) for p in gs['players_all']]
+        gs['players_all'] = players
+
+    if gs.get('players_in_game'):
+        players = [get_short_player(p) for p in gs['players_in_game']]
+        gs['players_in_game'] = players
+
+    return gs
+
+
+def get_game_summary(gc):
+    '''The fields a game is listed with'''
+    return {
+        'game_id': gc.game_id,
+        'status': gc.get_status().value,
+        'players': len(gc.players),
+        'created_at': gc.created_at,
+    }
+
+
 def show_game_state(gc):
     gs  = gc.get_game_state()
 
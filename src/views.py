@@ -0,0 +1,143 @@
+'''Per player views of a game
+
+A view shows a player their own hand, only the hand sizes of everyone else and
+a tail of the public events. Each game's view is kept up to date by applying
+the delta of every game event as it happens: the public fields are refreshed,
+and only the hands of the players the event affected are copied. Asking for a
+view then only puts together parts that are already built, and the events
+after `since` are read off the end of the tail.
+
+Views are versioned by the game version, GameController.version, which every
+game event moves on by one.
+'''
+from collections import deque
+import threading
+
+from .uno import PlayerCommand
+
+
+# command details anyone at the table may see, drawn cards never show up here
+PUBLIC_DETAILS = ['action', 'player_id', 'card', 'color_chosen', 'say_uno', 'challenge_succeeded', 'success']
+
+
+def public_event(version, event, details):
+    public = {'version': version, 'event': event}
+
+    for key in PUBLIC_DETAILS:
+        value = details.get(key)
+        if value is not None:
+            public[key] = value.name if key == 'action' else value
+
+    return public
+
+
+class GameView:
+    '''The public state of one game, followed through its events'''
+
+    def __init__(self, gc, tail_size):
+        self.gc = gc
+        self.lock = threading.Lock()
+
+        with self.lock:
+            # games are watched from creation, a view made later starts without the earlier events
+            self.events = deque(maxlen=tail_size)
+            self.hands = {} # player_id -> copy of the hand, for the players who asked for a view
+            self.public = {'hand_sizes': {}}
+            self.refresh(gc.players)
+
+        gc.event_listeners.append(self.on_game_event)
+
+    def refresh(self, changed):
+        '''Public fields at the current version, with new hand sizes for the changed players'''
+        gc = self.gc
+        current = gc.turn_tracker.get_current_turn_player()
+
+        # parts handed out in views are replaced rather than changed in place
+        hand_sizes = dict(self.public['hand_sizes'])
+        for p in changed:
+            # string keys, as in JSON, so MessagePack clients decode them the same way
+            hand_sizes[str(p.player_id)] = len(p.hand)
+            if p.player_id in self.hands:
+                self.hands[p.player_id] = list(p.hand)
+
+        self.public = {
+            'version': gc.version,
+            'status': gc.get_status().value,
+            'top_card': gc.discard_pile.get_last_card() if gc.discard_pile.cards else None,
+            'color_in_play': gc.color_in_play,
+            'turn_direction': gc.turn_tracker.turn_direction.name,
+            'current_turn_player_id': current.player_id if current else None,
+            'hand_sizes': hand_sizes,
+            'winners': [p.player_id for p in gc.winners],
+        }
+
+    def changed_players(self, gc, event, details):
+        if event == 'game_started':
+            return gc.players
+
+        # only the acting player and, for penalties, the previous player can change hands
+        changed = [p for p in gc.players if p.player_id == details.get('player_id')]
+        if details.get('action') in [PlayerCommand.CHALLENGE, PlayerCommand.CATCH]:
+            changed.append(gc.turn_tracker.get_previous_turn_player())
+
+        return changed
+
+    def on_game_event(self, gc, event, details):
+        with self.lock:
+            self.refresh(self.changed_players(gc, event, details))
+            self.events.append(public_event(gc.version, event, details))
+
+    def get(self, viewer, since=None):
+        '''
+        The view of viewer, a player of the game, with only the events after version
+        `since` when given. `truncated` tells when some of those already left the tail.
+        '''
+        with self.lock:
+            hand = self.hands.get(viewer.player_id)
+            if hand is None:
+                hand = self.hands[viewer.player_id] = list(viewer.hand)
+
+            if since is None:
+                events = list(self.events)
+                truncated = False
+            else:
+                events = []
+                for event in reversed(self.events):
+                    if event['version'] <= since:
+                        break
+                    events.append(event)
+                events.reverse()
+
+                first = events[0]['version'] if events else self.public['version'] + 1
+                truncated = first > since + 1
+
+            return {**self.public, 'hand': hand, 'events': events, 'truncated': truncated}
+
+
+class ViewStore:
+    '''GameViews by game_id'''
+
+    def __init__(self, tail_size=20):
+        self.tail_size = tail_size
+        self.views = {}
+        self.lock = threading.Lock()
+
+    def watch(self, gc):
+        '''Follow gc from now on, before its first event'''
+        with self.lock:
+            if gc.game_id not in self.views:
+                self.views[gc.game_id] = GameView(gc, self.tail_size)
+
+    def get_view(self, gc, player_id, since=None):
+        '''
+        The view of player_id, with only the events after version `since` when
+        given. Raises UnoPlayerNotFoundException if the player isn't at the table.
+        '''
+        viewer = gc.get_player_by_id(player_id)
+        game_view = self.views.get(gc.game_id)
+
+        if game_view is None:
+            self.watch(gc)
+            game_view = self.views[gc.game_id]
+
+        return game_view.get(viewer, since)
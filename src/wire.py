@@ -0,0 +1,219 @@
+'''MessagePack wire format
+
+Clients opt in through content negotiation: a `Content-Type: application/msgpack`
+request body is decoded and handed to validation as is, and the return value of
+an endpoint answering `Accept: application/msgpack` is packed straight to
+MessagePack, neither ever goes through JSON. Cards travel as their integer id
+(uno.CARD_TYPES) instead of a color/number/action object.
+'''
+from contextvars import ContextVar
+from enum import Enum
+import functools
+import json
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from starlette.requests import Request
+from starlette.responses import Response
+import msgpack
+
+from . import tracing
+from .tracing import traced_endpoint
+from .uno import CARD_IDS, Action, Card, Color, card_from_id
+
+
+MSGPACK = 'application/msgpack'
+
+# set by MsgPackRoute for the endpoint of the request being served
+wants_msgpack = ContextVar('wants_msgpack', default=False)
+
+CARD_FIELDS = {'color', 'number', 'action'}
+
+
+def is_msgpack(header_value):
+    return bool(header_value) and MSGPACK in header_value
+
+
+def pack(obj):
+    return msgpack.packb(obj, default=encode_value)
+
+
+def unpack(data):
+    return msgpack.unpackb(data)
+
+
+def encode_value(value):
+    if isinstance(value, Card):
+        return CARD_IDS[(value.color, value.number, value.action)]
+
+    if isinstance(value, Enum):
+        return value.value
+
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+
+    # anything else (models, dates) the way the JSON responses encode it
+    return jsonable_encoder(value)
+
+
+def card_id_to_model(card_id):
+    '''The CardModel shaped dict of a card id, an invalid id raises UnoInvalidCardException'''
+    card = card_from_id(card_id)
+
+    return {
+        'color': card.color.value.lower(),
+        'number': card.number,
+        'action': card.action.value.lower() if card.action else None,
+    }
+
+
+def compact_cards(obj):
+    '''Replace card objects of an already JSON encoded payload, such as an error response, with card ids'''
+    if isinstance(obj, dict):
+        if CARD_FIELDS <= obj.keys() and obj.get('color'):
+            color = Color[obj['color'].upper()]
+            action = Action[obj['action'].upper()] if obj['action'] else None
+            face = (color, obj['number'], action)
+            if face in CARD_IDS:
+                return CARD_IDS[face]
+
+        return {k: compact_cards(v) for k, v in obj.items()}
+
+    if isinstance(obj, list):
+        return [compact_cards(v) for v in obj]
+
+    return obj
+
+
+def expand_cards(obj):
+    '''Inverse of compact_cards for request bodies: `card` ids become CardModel dicts'''
+    if isinstance(obj, dict):
+        return {
+            k: card_id_to_model(v) if k == 'card' and isinstance(v, int) else expand_cards(v)
+            for k, v in obj.items()
+        }
+
+    if isinstance(obj, list):
+        return [expand_cards(v) for v in obj]
+
+    return obj
+
+
+def negotiated_endpoint(endpoint):
+    '''
+    Endpoint that encodes its own return value in an `encode` span, as MessagePack
+    when the client accepts it and as JSON otherwise
+    '''
+
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        content = await endpoint(*args, **kwargs)
+
+        if isinstance(content, Response):
+            return content
+
+        if wants_msgpack.get():
+            with tracing.span('encode', format='msgpack'):
+                return msgpack_response(content)
+
+        with tracing.span('encode', format='json'):
+            return JSONResponse(jsonable_encoder(content))
+
+    return wrapper
+
+
+class MsgPackRequest(Request):
+    '''Request whose MessagePack body is what the endpoint gets as its JSON body'''
+
+    async def json(self):
+        if not hasattr(self, '_json'):
+            with tracing.span('decode', format='msgpack'):
+                self._json = expand_cards(unpack(await self.body()))
+
+        return self._json
+
+
+def msgpack_request(request):
+    # announced as JSON so the body is validated like one, json() is never parsed as JSON though
+    headers = [(k, v) for k, v in request.scope['headers'] if k != b'content-type']
+    headers.append((b'content-type', b'application/json'))
+
+    return MsgPackRequest({**request.scope, 'headers': headers}, request.receive)
+
+
+class MsgPackRoute(APIRoute):
+    '''
+    Route that speaks MessagePack as well as JSON, picked by Content-Type and Accept.
+    The time spent in the `route` span outside of the endpoint's `handler` span
+    is request validation and response encoding.
+    '''
+
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, negotiated_endpoint(traced_endpoint(endpoint)), **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def route_handler(request):
+            if is_msgpack(request.headers.get('content-type')):
+                request = msgpack_request(request)
+
+            accept_msgpack = is_msgpack(request.headers.get('accept'))
+            tracer = request.app.state.uno.tracer
+
+            format_token = wants_msgpack.set(accept_msgpack)
+            tracer_token = tracing.current_tracer.set(tracer)
+            try:
+                with tracer.span('route', path=self.path):
+                    response = await handler(request)
+            except Exception as exc:
+                # answered here instead of by the app so msgpack clients get their errors packed too
+                exception_handler = lookup_exception_handler(request.app, exc)
+                if exception_handler is None or not accept_msgpack:
+                    raise
+                response = await exception_handler(request, exc)
+            finally:
+                tracing.current_tracer.reset(tracer_token)
+                wants_msgpack.reset(format_token)
+
+            # validation and HTTP errors are made by FastAPI as JSON
+            if accept_msgpack and isinstance(response, JSONResponse):
+                with tracing.span('encode', format='msgpack'):
+                    content = compact_cards(json.loads(response.body))
+                    headers = {k: v for k, v in response.headers.items() if k != 'content-length'}
+                    headers.pop('content-type', None)
+                    return Response(pack(content), response.status_code, headers, media_type=MSGPACK)
+
+            return response
+
+        return route_handler
+
+
+def lookup_exception_handler(app, exc):
+    '''The handler the app registered for exc, or for the nearest of its base classes'''
+    for cls in type(exc).__mro__:
+        if cls in app.exception_handlers:
+            return app.exception_handlers[cls]
+
+    return None
+
+
+def decode_bot_command(data):
+    '''
+    Fast path for trusted bots, no pydantic: the body is the msgpack array
+    [card_id, color_chosen, say_uno], each entry optional
+    '''
+    fields = unpack(data) if data else []
+    fields = list(fields) + [None] * (3 - len(fields))
+    card_id, color_chosen, say_uno = fields[:3]
+
+    return {
+        'card': card_from_id(card_id) if card_id is not None else None,
+        'color_chosen': Color[color_chosen.upper()] if color_chosen else None,
+        'say_uno': bool(say_uno),
+    }
+
+
+def msgpack_response(content):
+    return Response(pack(content), media_type=MSGPACK)
@@ -0,0 +1,108 @@
+'''Games for the tests to set up and play, kept apart from the benchmark scripts'''
+import random
+
+from src.uno import Action, Color, GameController, GameStatus, Player, PlayerCommand, settings
+
+
+MAX_COMMANDS = 3000
+
+
+def new_game(*watchers, players=3, seed=1, rules=settings, start=True):
+    '''
+    A game for players, a count or a list of display names, with every
+    watcher(gc) hooked up before anyone joins
+    '''
+    gc = GameController(rules, seed=seed)
+    for watch in watchers:
+        watch(gc)
+
+    names = [f'p{idx}' for idx in range(players)] if isinstance(players, int) else players
+    for name in names:
+        Player(name).join_game(gc)
+
+    if start:
+        gc.start()
+
+    return gc
+
+
+def create_game(client, players=('ann', 'bob'), start=True):
+    '''The same through the API, returns (game_id, [player_id, ...])'''
+    game_id = client.post('/game/new').json()['game_id']
+    player_ids = []
+
+    for name in players:
+        player = client.post(f'/game/{game_id}/player/new', json={'display_name': name}).json()['player']
+        client.post(f'/game/{game_id}/player/{player["player_id"]}/join')
+        player_ids.append(player['player_id'])
+
+    if start:
+        client.post(f'/game/{game_id}/start')
+
+    return game_id, player_ids
+
+
+def command(gc, player, details):
+    return gc.process_player_command(player.player_id, details)
+
+
+def discard(gc, player, card, rng):
+    details = {'action': PlayerCommand.DISCARD, 'card': card}
+
+    if card.can_choose_card_color:
+        details['color_chosen'] = rng.choice([Color.RED, Color.GREEN, Color.BLUE, Color.YELLOW])
+    if len(player.hand) == 2 and rng.random() < 0.8:
+        details['say_uno'] = True
+
+    command(gc, player, details)
+
+
+def play_turn(gc, rng):
+    '''A random but legal turn for the current player, with the odd challenge or catch'''
+    player = gc.turn_tracker.get_current_turn_player()
+    previous = gc.turn_tracker.get_previous_turn_player()
+    last = gc.history[-1] if gc.history else None
+
+    if last and last['action'] == PlayerCommand.DISCARD and previous and rng.random() < 0.3:
+        if gc.discard_pile.get_last_card().action == Action.DRAW4 and gc.draw_stack_quantity:
+            command(gc, player, {'action': PlayerCommand.CHALLENGE})
+            return
+
+        if len(previous.hand) == 1 and not last.get('say_uno'):
+            command(gc, player, {'action': PlayerCommand.CATCH})
+            return
+
+    playable = [card for card in player.hand if gc.is_valid_card_to_play(card)]
+    if playable:
+        discard(gc, player, rng.choice(playable), rng)
+        return
+
+    stacked = gc.draw_stack_quantity
+    drawn = command(gc, player, {'action': PlayerCommand.DRAW})
+
+    # drawing a stack passes the turn on by itself
+    if not stacked:
+        if gc.is_valid_card_to_play(drawn[0]):
+            discard(gc, player, drawn[0], rng)
+        else:
+            command(gc, player, {'action': PlayerCommand.END_TURN})
+
+
+def play_out(gc, rng, max_commands=MAX_COMMANDS):
+    '''Play random turns until the game is won, or gives up after max_commands'''
+    while gc.get_status() != GameStatus.FINISHED and len(gc.history) < max_commands:
+        play_turn(gc, rng)
+
+    return gc.get_status() == GameStatus.FINISHED
+
+
+def play_games(num_games, *watchers, seed=0):
+    '''Self play num_games games of 2 to 6 players, returns how many were won'''
+    rng = random.Random(seed)
+    finished = 0
+
+    for _ in range(num_games):
+        gc = new_game(*watchers, players=rng.randint(2, 6), seed=rng.randrange(2 ** 64))
+        finished += play_out(gc, rng)
+
+    return finished
@@ -0,0 +1,75 @@
+import asyncio
+from contextlib import AsyncExitStack
+
+import httpx
+import pytest
+
+from src.admission import AdmissionController, UnoGameBusy, UnoServerBusy
+from src.main import create_app
+
+
+def test_full_queues_are_turned_away():
+    admission = AdmissionController(max_in_flight=3, max_queue_per_game=2, retry_after=5)
+
+    async def fill():
+        async with AsyncExitStack() as stack:
+            for game_id in [1, 1]:
+                await stack.enter_async_context(admission.admit(game_id))
+            with pytest.raises(UnoGameBusy) as game_busy:
+                await stack.enter_async_context(admission.admit(1))
+
+            await stack.enter_async_context(admission.admit(2))
+            with pytest.raises(UnoServerBusy):
+                await stack.enter_async_context(admission.admit(3))
+
+            assert game_busy.value.retry_after == 5
+            assert admission.get_stats()['hottest_games'][0] == {'game_id': 1, 'queued': 2}
+
+    asyncio.run(fill())
+
+    stats = admission.get_stats()
+    assert stats['in_flight'] == 0 and admission.depths == {}
+    assert stats['admitted'] == 3 and stats['peak_in_flight'] == 3
+    assert stats['rejected_game_busy'] == stats['rejected_server_busy'] == 1
+
+
+def test_failed_commands_give_back_their_place():
+    admission = AdmissionController()
+
+    async def fail():
+        async with admission.admit(1):
+            raise ValueError
+
+    with pytest.raises(ValueError):
+        asyncio.run(fail())
+
+    assert admission.in_flight == 0 and admission.depths == {}
+
+
+def test_busy_games_and_servers_answer_with_retry_after():
+    app = create_app({'turn_timeout': 0, 'game_queue_size': 1, 'max_in_flight_commands': 3})
+    admission = app.state.uno.admission
+
+    async def play():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            tables = {'tables': [{'players': ['ann', 'bob']}] * 3}
+            games = (await client.post('/game/provision', json=tables)).json()['games']
+            draw = [f'/game/{g["game_id"]}/player/{g["players"][0]["player_id"]}/draw' for g in games]
+
+            # a command of the first game is still running, then one of every game
+            async with AsyncExitStack() as stack:
+                await stack.enter_async_context(admission.admit(games[0]['game_id']))
+                game_busy = await client.post(draw[0])
+
+                for game in games[1:]:
+                    await stack.enter_async_context(admission.admit(game['game_id']))
+                server_busy = await client.post(draw[1])
+
+            return game_busy, server_busy, await client.get('/admission/stats')
+
+    game_busy, server_busy, stats = asyncio.run(play())
+
+    assert game_busy.status_code == 429 and game_busy.headers['Retry-After'] == '1'
+    assert server_busy.status_code == 503 and server_busy.headers['Retry-After'] == '1'
+    assert stats.json()['in_flight'] == 0 and stats.json()['busy_games'] == 0
@@ -0,0 +1,90 @@
+import itertools
+import json
+import random
+
+from fastapi.testclient import TestClient
+
+from conftest import create_game, new_game, play_out
+from src import export
+from src.main import create_app
+from src.registry import GameRegistry
+from src.uno import GameStatus
+
+
+def make_registry(num_games=6):
+    '''Games created at 1000.0, 1001.0, ..., the even ones played out and the odd ones still waiting'''
+    registry = GameRegistry(clock=itertools.count(1000.0).__next__)
+    rng = random.Random(5)
+
+    for idx in range(num_games):
+        gc = new_game(players=2, seed=idx, start=False)
+        registry.append(gc)
+        if idx % 2 == 0:
+            gc.start()
+            play_out(gc, rng)
+
+    return registry
+
+
+def read_ndjson(lines):
+    return [json.loads(line) for line in lines]
+
+
+def test_games_are_filtered_by_creation_time_and_status():
+    registry = make_registry()
+    games = list(registry)
+
+    assert list(export.iter_games(registry, since=1001.0, until=1004.0)) == games[1:4]
+    assert list(export.iter_games(registry, status='waiting')) == games[1::2]
+    assert list(export.iter_games(registry, since=1002.0, status=GameStatus.WAITING)) == games[3::2]
+
+
+def test_ndjson_has_a_summary_then_the_events_of_every_game():
+    registry = make_registry()
+    games = list(registry)[:3]
+
+    records = read_ndjson(export.iter_ndjson(registry, until=1003.0))
+    summaries = [r for r in records if r['type'] == 'game']
+
+    assert [s['game_id'] for s in summaries] == [g.game_id for g in games]
+    assert [s['commands'] for s in summaries] == [len(g.history) for g in games]
+    assert len(records) == len(games) + sum(len(g.history) for g in games)
+
+    first_events = records[1:1 + len(games[0].history)]
+    assert [e['seq'] for e in first_events] == list(range(len(games[0].history)))
+    assert {e['game_id'] for e in first_events} == {games[0].game_id}
+
+
+def test_columnar_batches_hold_the_same_events():
+    registry = make_registry()
+
+    events = [r for r in read_ndjson(export.iter_ndjson(registry)) if r['type'] == 'event']
+    batches = read_ndjson(export.iter_columnar_ndjson(registry, batch_size=100))
+
+    assert all(len(b['seq']) == 100 for b in batches[:-1])
+    assert sum(len(b['seq']) for b in batches) == len(events)
+
+    columns = {column: [v for b in batches for v in b[column]] for column in batches[0]}
+    assert columns['action'] == [e['action'] for e in events]
+    assert columns['card'] == [e['card'] for e in events]
+    assert columns['game_id'] == [e['game_id'] for e in events]
+
+
+def test_export_endpoint_streams_the_filtered_games():
+    app = create_app({'turn_timeout': 0})
+    # one second between games so the time filters split them
+    app.state.uno.games.clock = itertools.count(1000.0).__next__
+
+    with TestClient(app) as client:
+        playing, _ = create_game(client)
+        waiting, _ = create_game(client, start=False)
+
+        def summaries(**params):
+            response = client.get('/export/history', params=params)
+            assert response.headers['content-type'].startswith('application/x-ndjson')
+            return [r['game_id'] for r in read_ndjson(response.iter_lines()) if r['type'] == 'game']
+
+        assert summaries() == [playing, waiting]
+        assert summaries(status='waiting') == [waiting]
+        assert summaries(since=1001.0) == [waiting]
+        assert summaries(until=1001.0) == [playing]
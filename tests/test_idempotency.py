@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from conftest import create_game
+from src.idempotency import ResponseCache
+from src.main import create_app
+from src.state import UnoState
+
+
+def test_concurrent_retries_run_the_command_once():
+    cache = ResponseCache()
+    calls = []
+
+    async def handler():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {'success': True, 'drawn': len(calls)}
+
+    async def retry_three_times():
+        return await asyncio.gather(*(cache.get_or_run('key', handler) for _ in range(3)))
+
+    responses = asyncio.run(retry_three_times())
+
+    assert len(calls) == 1
+    assert responses == [{'success': True, 'drawn': 1}] * 3
+    assert cache.get_stats()['hits'] == 2 and cache.get_stats()['misses'] == 1
+
+
+def test_exceptions_are_not_cached():
+    cache = ResponseCache()
+    results = iter([ValueError('busy'), {'success': True}])
+
+    async def handler():
+        await asyncio.sleep(0.01)
+        result = next(results)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def retry_twice():
+        # the concurrent retry shares the failure, the one after runs the command again
+        failed = await asyncio.gather(*(cache.get_or_run('key', handler) for _ in range(2)), return_exceptions=True)
+        assert [type(e) for e in failed] == [ValueError, ValueError]
+
+        return await cache.get_or_run('key', handler)
+
+    assert asyncio.run(retry_twice()) == {'success': True}
+    assert cache.pending == {}
+    assert cache.get_stats()['entries'] == 1
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = ResponseCache(max_entries=2)
+
+    async def fill():
+        for key in ['a', 'b', 'a', 'c']:
+            await cache.get_or_run(key, lambda: asyncio.sleep(0, result=key))
+
+    asyncio.run(fill())
+
+    assert list(cache.entries) == ['a', 'c']
+    assert cache.get_stats()['evictions'] == 1
+
+
+def test_caches_are_kept_for_the_most_recent_games():
+    state = UnoState({'turn_timeout': 0, 'idempotency_cache_size': 8, 'idempotency_cache_games': 2})
+
+    first = state.get_response_cache(1)
+    state.get_response_cache(2)
+    assert state.get_response_cache(1) is first
+
+    state.get_response_cache(3)
+
+    assert list(state.response_caches) == [1, 3]
+    assert first.max_entries == 8
+
+
+def test_retried_commands_get_the_original_response():
+    app = create_app({'turn_timeout': 0, 'idempotency_cache_size': 8})
+
+    with TestClient(app) as client:
+        game_id, _ = create_game(client)
+        assert client.get(f'/game/{game_id}/idempotency').json()['stats']['max_entries'] == 8
+
+        player_id = client.get(f'/game/{game_id}/state').json()['game_state']['current_turn_player']['player_id']
+        path = f'/game/{game_id}/player/{player_id}/draw'
+        responses = [client.post(path, headers={'Idempotency-Key': 'draw-1'}).json() for _ in range(3)]
+        stats = client.get(f'/game/{game_id}/idempotency').json()['stats']
+
+        assert responses[0] == responses[1] == responses[2]
+        assert len(app.state.uno.get_game_by_id(game_id).history) == 1
+        assert stats['hits'] == 2 and stats['entries'] == 1
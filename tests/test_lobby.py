@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from src.lobby import UnoLobbyTicketNotFound
+from src.state import UnoState
+
+
+def new_lobby(**config):
+    state = UnoState({'turn_timeout': 0, **config})
+    return state, state.lobby
+
+
+def test_full_tables_are_seated_at_their_own_games():
+    state, lobby = new_lobby()
+    tickets = [lobby.enqueue(f'p{idx}', 2) for idx in range(5)]
+    quick = [lobby.enqueue(f'q{idx}', 2, 'quick') for idx in range(2)]
+
+    matched = asyncio.run(lobby.match())
+
+    assert len(matched) == 6
+    assert not tickets[4].matched
+    assert lobby.get_stats()['queued'] == {'2:default': 1, '2:quick': 0}
+
+    for first, second in [tickets[0:2], tickets[2:4], quick]:
+        assert first.game_id == second.game_id
+        gc = state.get_game_by_id(first.game_id)
+        assert [p.player_id for p in gc.players] == [first.player_id, second.player_id]
+        assert [p.display_name for p in gc.players] == [first.display_name, second.display_name]
+
+    assert len(state.get_game_by_id(quick[0].game_id).players[0].hand) == 5
+
+
+def test_cancelled_tickets_give_up_their_seat():
+    _, lobby = new_lobby()
+    tickets = [lobby.enqueue(f'p{idx}', 2) for idx in range(3)]
+
+    assert lobby.cancel(tickets[1].ticket_id)
+    asyncio.run(lobby.match())
+
+    assert tickets[0].game_id == tickets[2].game_id
+    assert not lobby.cancel(tickets[0].ticket_id)
+    with pytest.raises(UnoLobbyTicketNotFound):
+        lobby.get_ticket(tickets[1].ticket_id)
+
+
+def test_cancel_wakes_the_long_poll():
+    _, lobby = new_lobby()
+    ticket = lobby.enqueue('ann', 2)
+
+    async def poll_and_cancel():
+        poll = asyncio.create_task(lobby.wait_for_match(ticket.ticket_id, 5))
+        await asyncio.sleep(0)
+        lobby.cancel(ticket.ticket_id)
+        return await asyncio.wait_for(poll, 1)
+
+    assert not asyncio.run(poll_and_cancel()).matched
+    assert lobby.waiters == {}
+
+
+def test_collected_and_expired_tickets_are_dropped():
+    _, lobby = new_lobby(lobby_ticket_ttl=10)
+    collected, uncollected = lobby.enqueue('ann', 2), lobby.enqueue('bob', 2)
+    asyncio.run(lobby.match())
+
+    assert asyncio.run(lobby.wait_for_match(collected.ticket_id, 0)).matched
+    with pytest.raises(UnoLobbyTicketNotFound):
+        lobby.get_ticket(collected.ticket_id)
+
+    lobby.expire_tickets(now=uncollected.matched_at + 5)
+    assert lobby.get_ticket(uncollected.ticket_id) is uncollected
+
+    lobby.expire_tickets(now=uncollected.matched_at + 11)
+    with pytest.raises(UnoLobbyTicketNotFound):
+        lobby.get_ticket(uncollected.ticket_id)
+
+
+def test_ticket_ids_are_never_reused():
+    _, lobby = new_lobby(lobby_ticket_ttl=0)
+    seen = set()
+
+    for _ in range(20):
+        tickets = [lobby.enqueue(name, 2) for name in ['ann', 'bob']]
+        asyncio.run(lobby.match())
+        lobby.expire_tickets(now=tickets[0].matched_at + 1)
+
+        ids = {ticket.ticket_id for ticket in tickets}
+        assert not ids & seen
+        seen |= ids
@@ -0,0 +1,110 @@
+import itertools
+import random
+
+from conftest import new_game
+from src.registry import GameRegistry
+from src.uno import GameStatus, Player
+
+
+def make_registry(num_games=60, seed=3):
+    rng = random.Random(seed)
+    # the n-th game is registered at 1000.0 + n
+    registry = GameRegistry(clock=itertools.count(1000.0).__next__)
+
+    for idx in range(num_games):
+        gc = new_game(players=0, seed=idx, start=False)
+        registry.append(gc)
+
+        # players join and games start after registration, the indexes follow the events
+        for p in range(rng.randint(0, 4)):
+            Player(f'p{p}').join_game(gc)
+        if len(gc.players) >= 2 and rng.random() < 0.5:
+            gc.start()
+
+    return registry
+
+
+def list_all(registry, limit, **filters):
+    '''Every page of a listing, following the cursors'''
+    games = []
+    cursor = None
+
+    while True:
+        page, cursor = registry.list_games(cursor=cursor, limit=limit, **filters)
+        assert len(page) <= limit
+        games.extend(page)
+        if cursor is None:
+            return games
+
+
+def expected(registry, status=None, player_count=None, created_after=None, created_before=None):
+    return [
+        gc for gc in registry
+        if (status is None or gc.get_status() == status)
+        and (player_count is None or len(gc.players) == player_count)
+        and (created_after is None or gc.created_at >= created_after)
+        and (created_before is None or gc.created_at < created_before)
+    ]
+
+
+def test_pages_cover_every_game_once_in_creation_order():
+    registry = make_registry()
+
+    for limit in [1, 7, 60, 100]:
+        assert list_all(registry, limit) == list(registry)
+
+
+def test_filters_and_pagination_match_a_full_scan():
+    registry = make_registry()
+    rng = random.Random(5)
+
+    for _ in range(50):
+        filters = {
+            'status': rng.choice([None, *GameStatus]),
+            'player_count': rng.choice([None, 0, 2, 3, 4]),
+            'created_after': rng.choice([None, 1000.0 + rng.randrange(60)]),
+            'created_before': rng.choice([None, 1000.0 + rng.randrange(60)]),
+        }
+        limit = rng.randint(1, 10)
+
+        assert list_all(registry, limit, **filters) == expected(registry, **filters)
+
+
+def test_status_index_follows_the_games():
+    registry = make_registry()
+    waiting = [gc for gc in registry if gc.get_status() == GameStatus.WAITING and len(gc.players) >= 2]
+
+    for gc in waiting:
+        gc.start()
+
+    assert list_all(registry, 5, status=GameStatus.WAITING) == expected(registry, status=GameStatus.WAITING)
+    assert set(waiting) <= set(list_all(registry, 5, status=GameStatus.IN_PROGRESS))
+
+
+def test_last_full_page_has_no_cursor():
+    registry = make_registry(num_games=10)
+
+    page, cursor = registry.list_games(limit=10)
+
+    assert len(page) == 10
+    assert cursor is None
+
+
+def test_games_registered_out_of_order_keep_the_time_filters_right():
+    clock = iter([10.0, 12.0, 11.0, 13.0]).__next__
+    registry = GameRegistry(clock=clock)
+
+    # a batch is built in a thread while another game is created and registered
+    batch = [new_game(players=2) for _ in range(2)]
+    single = new_game(players=2)
+    registry.append(single)
+    registry.extend(batch)
+    registry.append(new_game(players=2))
+
+    assert [created_at for created_at, _ in registry.created] == [10.0, 12.0, 12.0, 13.0]
+    assert [gc.created_at for gc in registry] == [10.0, 12.0, 12.0, 13.0]
+
+    for created_after in [None, 10.0, 11.0, 12.0, 13.0]:
+        for created_before in [None, 10.0, 12.0, 12.5, 14.0]:
+            filters = {'created_after': created_after, 'created_before': created_before}
+            assert list_all(registry, 2, **filters) == expected(registry, **filters)
@@ -0,0 +1,58 @@
+import asyncio
+import random
+
+from conftest import new_game, play_games, play_out
+from src.replay import CorpusRecorder, iter_corpus, replay_corpus
+
+
+def record(path, num_games, seed):
+    recorder = CorpusRecorder(path)
+    play_games(num_games, recorder.watch, seed=seed)
+    recorder.flush()
+    return recorder.games_written
+
+
+def test_recorded_games_replay_the_same(tmp_path):
+    path = tmp_path / 'corpus.bin'
+    written = record(path, 30, seed=3)
+
+    games, failures, _ = replay_corpus(path)
+
+    assert written > 0
+    assert games == written
+    assert failures == {}
+
+
+def test_finished_games_are_buffered_until_flushed(tmp_path):
+    path = tmp_path / 'corpus.bin'
+    recorder = CorpusRecorder(path)
+    rng = random.Random(4)
+
+    assert play_out(new_game(recorder.watch), rng)
+
+    assert len(recorder.pending) == 1
+    assert not path.exists()
+
+    recorder.flush()
+    assert recorder.pending == []
+    assert recorder.games_written == 1
+    assert len(list(iter_corpus(path))) == 1
+
+
+def test_run_flushes_on_shutdown(tmp_path):
+    source = tmp_path / 'source.bin'
+    record(source, 5, seed=5)
+
+    path = tmp_path / 'corpus.bin'
+    recorder = CorpusRecorder(path, flush_interval=60)
+
+    async def serve():
+        task = asyncio.create_task(recorder.run())
+        await asyncio.sleep(0)
+        recorder.pending.append(source.read_bytes())
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(serve())
+
+    assert path.read_bytes() == source.read_bytes()
@@ -0,0 +1,71 @@
+import random
+
+from conftest import new_game, play_out
+from src.stats import Leaderboard, SkipList
+
+
+def check(skip_list, keys):
+    assert len(skip_list) == len(keys)
+    assert skip_list.first(len(keys) + 1) == keys
+
+    for rank, key in enumerate(keys):
+        assert skip_list.rank(key) == rank
+
+
+def test_skip_list_ranks_under_random_inserts_and_removes():
+    rng = random.Random(5)
+    skip_list = SkipList(seed=5)
+    keys = []
+
+    for step in range(3000):
+        if keys and rng.random() < 0.4:
+            key = keys.pop(rng.randrange(len(keys)))
+            skip_list.remove(key)
+        else:
+            key = rng.random()
+            keys.append(key)
+            keys.sort()
+            skip_list.insert(key)
+
+        if step % 100 == 0:
+            check(skip_list, keys)
+
+    check(skip_list, keys)
+
+
+def test_skip_list_updates_keep_order():
+    rng = random.Random(6)
+    skip_list = SkipList(seed=6)
+    scores = {name: (0, name) for name in range(200)}
+    for key in scores.values():
+        skip_list.insert(key)
+
+    # re-ranking is a remove and an insert, as on the leaderboard
+    for _ in range(2000):
+        name = rng.randrange(200)
+        skip_list.remove(scores[name])
+        scores[name] = (scores[name][0] - rng.randint(0, 3), name)
+        skip_list.insert(scores[name])
+
+    check(skip_list, sorted(scores.values()))
+
+
+def test_leaderboard_ranks_match_a_full_sort():
+    leaderboard = Leaderboard()
+    rng = random.Random(7)
+    names = [f'bot {idx}' for idx in range(8)]
+    finished = 0
+
+    for _ in range(40):
+        players = rng.sample(names, rng.randint(2, 4))
+        gc = new_game(leaderboard.watch, players=players, seed=rng.randrange(2 ** 32))
+        finished += play_out(gc, rng)
+
+    expected = sorted(leaderboard.players.values(), key=lambda stats: stats.ranking_key())
+    top = leaderboard.top(len(names))
+
+    assert [p['display_name'] for p in top] == [stats.display_name for stats in expected]
+    for rank, stats in enumerate(expected, 1):
+        assert leaderboard.get_stats(stats.display_name)['rank'] == rank
+
+    assert sum(stats.wins for stats in expected) == finished
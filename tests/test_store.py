@@ -0,0 +1,140 @@
+'''The same API calls give the same answers from the local and the sharded store'''
+import pytest
+from fastapi.testclient import TestClient
+
+from conftest import create_game
+from src.main import create_app
+
+
+@pytest.fixture(scope='module', params=[0, 3], ids=['local', 'sharded'])
+def client(request):
+    app = create_app({'engine_shards': request.param, 'turn_timeout': 0, 'rule_set': 'default'})
+
+    with TestClient(app) as client:
+        yield client
+
+
+def current_player(client, game_id):
+    return client.get(f'/game/{game_id}/state').json()['game_state']['current_turn_player']['player_id']
+
+
+def list_all(client, **query):
+    games, cursor = [], None
+
+    while True:
+        params = {**query, **({'cursor': cursor} if cursor is not None else {})}
+        page = client.get('/game/list', params=params).json()
+        games.extend(g['game_id'] for g in page['games'])
+
+        cursor = page['next_cursor']
+        if cursor is None:
+            return games
+
+
+def test_commands_play_through_the_store(client):
+    game_id, _ = create_game(client)
+    player_id = current_player(client, game_id)
+
+    drawn = client.post(f'/game/{game_id}/player/{player_id}/draw').json()
+    view = client.get(f'/game/{game_id}/player/{player_id}/view').json()['view']
+
+    assert drawn['success']
+    assert view['events'][-1]['action'] == 'DRAW'
+    assert len(view['hand']) == 8
+
+
+def test_commands_for_another_game_are_not_found(client):
+    game_id, _ = create_game(client)
+    other_game_id, other_player_ids = create_game(client)
+
+    response = client.post(f'/game/{game_id}/player/{other_player_ids[0]}/draw')
+
+    assert response.status_code == 404
+    assert client.get('/admission/stats').json()['in_flight'] == 0
+
+
+@pytest.mark.parametrize('method, path', [
+    ('get', '/game/{}/state'),
+    ('get', '/game/{}/player/1/view'),
+    ('get', '/game/{}/player/1/evaluate'),
+    ('post', '/game/{}/player/1/join'),
+    ('post', '/game/{}/start'),
+])
+def test_unknown_games_are_not_found(client, method, path):
+    response = getattr(client, method)(path.format(999999))
+
+    assert response.status_code == 404
+    assert response.json()['detail'] == 'Game 999999 not found'
+
+
+def test_unknown_players_are_not_found(client):
+    game_id, player_ids = create_game(client, start=False)
+
+    new_player = client.post('/game/999999/player/new', json={'display_name': 'cat'})
+    join = client.post(f'/game/{game_id}/player/999999/join')
+    view = client.get(f'/game/{game_id}/player/999999/view')
+
+    assert new_player.status_code == 404
+    assert join.status_code == view.status_code == 404
+    assert view.json()['detail'] == f'Player 999999 is not in game {game_id}'
+
+
+def test_listing_filters_and_pages(client):
+    waiting = [create_game(client, players=['cat'] * 3, start=False)[0] for _ in range(4)]
+    playing = [create_game(client, players=['dan'] * 3)[0] for _ in range(5)]
+
+    # oldest first, every game once
+    listed = list_all(client, players=3, limit=2)
+    assert len(listed) == len(set(listed))
+    assert [g for g in listed if g in waiting + playing] == waiting + playing
+
+    listed_waiting = list_all(client, players=3, status='waiting', limit=3)
+    assert [g for g in listed_waiting if g in waiting + playing] == waiting
+
+
+def test_provision_plays_by_the_rule_set(client):
+    games = client.post('/game/provision', json={'tables': [{'players': ['a', 'b']}], 'rule_set': 'quick'}).json()
+    game_id = games['games'][0]['game_id']
+
+    players = client.get(f'/game/{game_id}/state').json()['game_state']['players_all']
+    assert [p['hand_size'] for p in players] == [5, 5]
+
+
+def test_evaluate_moves(client):
+    game_id, _ = create_game(client)
+    player_id = current_player(client, game_id)
+
+    moves = client.get(f'/game/{game_id}/player/{player_id}/evaluate', params={'budget_ms': 50}).json()['moves']
+    assert moves
+
+    waiting = next(p for p in client.get(f'/game/{game_id}/state').json()['game_state']['players_all']
+                   if p['player_id'] != player_id)
+    response = client.get(f'/game/{game_id}/player/{waiting["player_id"]}/evaluate', params={'budget_ms': 50})
+    assert response.status_code == 409
+
+
+def test_provisioned_games_have_views_from_the_start(client):
+    games = client.post('/game/provision', json={'tables': [{'players': ['a', 'b', 'c']}]}).json()
+    game = games['games'][0]
+    player_ids = [p['player_id'] for p in game['players']]
+
+    view = client.get(f'/game/{game["game_id"]}/player/{player_ids[0]}/view').json()['view']
+
+    assert view['hand_sizes'] == {str(player_id): 7 for player_id in player_ids}
+    assert [e['event'] for e in view['events']][-1] == 'game_started'
+
+
+def test_lobby_seats_players_at_playable_games(client):
+    tickets = [
+        client.post('/lobby/enqueue', json={'display_name': name, 'table_size': 2}).json()['ticket']['ticket_id']
+        for name in ['eve', 'fay']
+    ]
+    seats = [client.get(f'/lobby/ticket/{ticket_id}', params={'wait': 5}).json()['ticket'] for ticket_id in tickets]
+
+    game_id = seats[0]['game_id']
+    assert all(seat['matched'] and seat['game_id'] == game_id for seat in seats)
+    assert game_id in list_all(client, players=2)
+
+    player_id = current_player(client, game_id)
+    assert player_id in [seat['player_id'] for seat in seats]
+    assert client.post(f'/game/{game_id}/player/{player_id}/draw').status_code == 200
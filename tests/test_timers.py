@@ -0,0 +1,135 @@
+import asyncio
+
+from src.state import UnoState
+from src.timers import TimerWheel, TurnTimers, draw_and_keep
+from conftest import new_game
+from src.uno import Card, GameStatus, PlayerCommand
+
+
+def test_wheel_fires_after_delay():
+    wheel = TimerWheel(tick=1, num_slots=4)
+    fired = []
+    wheel.schedule(3, lambda: fired.append('a'))
+
+    assert [cb() for cb in wheel.advance() + wheel.advance()] == []
+    for callback in wheel.advance():
+        callback()
+
+    assert fired == ['a']
+    assert len(wheel) == 0
+
+
+def test_wheel_delay_longer_than_a_turn_of_the_wheel():
+    wheel = TimerWheel(tick=1, num_slots=4)
+    timer = wheel.schedule(10, lambda: None)
+
+    ticks = 1
+    while not wheel.advance():
+        ticks += 1
+
+    assert ticks == 10
+    assert not wheel.cancel(timer)
+
+
+def test_wheel_cancel():
+    wheel = TimerWheel(tick=1, num_slots=4)
+    timer = wheel.schedule(2, lambda: None)
+
+    assert wheel.cancel(timer)
+    assert not wheel.cancel(timer)
+    assert wheel.advance() + wheel.advance() == []
+
+
+def test_empty_wheel_is_kept():
+    wheel = TimerWheel()
+    assert TurnTimers(wheel=wheel).wheel is wheel
+
+
+def expire_next(timers):
+    '''Turn the wheel until the next timers go off'''
+    for _ in range(len(timers.wheel.slots) + 1):
+        callbacks = timers.wheel.advance()
+        for callback in callbacks:
+            callback()
+        if callbacks:
+            return
+
+
+def test_timed_out_turn_is_drawn_and_kept():
+    timers = TurnTimers(timeout=0.1)
+    gc = new_game(timers.watch)
+    current = gc.turn_tracker.get_current_turn_player()
+    hand_size = len(current.hand)
+
+    expire_next(timers)
+
+    assert timers.expired == 1
+    assert gc.history[0]['player_id'] == current.player_id
+    assert gc.history[0]['action'] == PlayerCommand.DRAW
+    assert gc.history[0]['forced_draw']
+    assert gc.turn_tracker.get_current_turn_player() is not current
+    assert len(current.hand) > hand_size
+
+
+def test_no_timer_once_the_game_is_won():
+    timers = TurnTimers(timeout=0.1)
+    gc = new_game(timers.watch, players=2)
+    winner, loser = gc.players
+
+    if gc.turn_tracker.get_current_turn_player() is not winner:
+        winner, loser = loser, winner
+    top = gc.discard_pile.get_last_card()
+    winner.hand = [Card(top.color, top.number, None)]
+    winner.discard({'card': winner.hand[0]})
+
+    assert gc.get_status() == GameStatus.FINISHED
+    assert timers.deadlines == {}
+
+    loser_hand = list(loser.hand)
+    expire_next(timers)
+
+    assert timers.expired == 0
+    assert loser.hand == loser_hand
+
+
+def play_timed_out_turn(**config):
+    async def play():
+        state = UnoState({'turn_timeout': 0.1, **config})
+        timers = state.turn_timers
+
+        game_id = await state.store.new_game()
+        gc = state.get_game_by_id(game_id)
+        for name in ['a', 'b']:
+            player_id = await state.store.new_player(game_id, name)
+            await state.store.join(game_id, player_id)
+        await state.store.start(game_id)
+
+        # a player command holds the game while the turn expires
+        async with state.store.lock(game_id):
+            expire_next(timers)
+            await asyncio.sleep(0)
+            assert gc.history == []
+
+        await asyncio.gather(*timers.running)
+        return gc
+
+    return asyncio.run(play())
+
+
+def test_time_out_waits_for_the_game_lock():
+    gc = play_timed_out_turn()
+    assert gc.history[0]['action'] == PlayerCommand.DRAW
+    assert gc.history[0]['forced_draw']
+
+
+def test_configured_timeout_action():
+    timed_out = []
+
+    def action(gc, player):
+        timed_out.append(player.player_id)
+        draw_and_keep(gc, player)
+
+    gc = play_timed_out_turn(turn_timeout_action=action)
+
+    assert timed_out == [gc.history[0]['player_id']]
+    assert gc.history[0]['forced_draw']
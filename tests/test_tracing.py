@@ -0,0 +1,66 @@
+import asyncio
+import json
+import time
+
+from src import tracing
+from src.tracing import FileExporter, InMemoryExporter, Tracer
+
+
+def trace_request(tracer, sleep=0):
+    with tracing.request_trace(tracer, 'http', path='/game/new'):
+        with tracing.span('handler'):
+            with tracing.span('engine.command'):
+                tracing.tag(player_id=1)
+                time.sleep(sleep)
+
+
+def names(trace):
+    return [trace['name'], *(name for child in trace['children'] for name in names(child))]
+
+
+def test_slow_requests_log_their_whole_tree_when_not_sampled():
+    tracer = Tracer(sample_rate=0, slow_threshold_ms=5)
+
+    trace_request(tracer)
+    trace_request(tracer, sleep=0.01)
+
+    assert tracer.exporter.get_traces() == []
+    slow, = tracer.slow_traces
+    assert names(slow) == ['http', 'handler', 'engine.command']
+    assert slow['children'][0]['children'][0]['tags'] == {'player_id': 1}
+
+
+def test_sampled_requests_are_exported():
+    tracer = Tracer(exporter=InMemoryExporter(), sample_rate=1)
+
+    trace_request(tracer)
+
+    trace, = tracer.exporter.get_traces()
+    assert names(trace) == ['http', 'handler', 'engine.command']
+
+
+def test_spans_outside_a_request_do_nothing():
+    with tracing.span('engine.command') as span:
+        span.tag(player_id=1)
+
+    assert span is tracing.NOOP_SPAN
+
+
+def test_file_exporter_writes_from_run(tmp_path):
+    path = tmp_path / 'traces.jsonl'
+    tracer = Tracer(exporter=FileExporter(path, flush_interval=60), sample_rate=1)
+
+    async def serve():
+        task = asyncio.create_task(tracer.exporter.run())
+        trace_request(tracer)
+        trace_request(tracer)
+        await asyncio.sleep(0)
+        assert not path.exists()
+
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(serve())
+
+    lines = path.read_text().splitlines()
+    assert [names(json.loads(line)) for line in lines] == [['http', 'handler', 'engine.command']] * 2
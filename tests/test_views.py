@@ -0,0 +1,69 @@
+import random
+
+from conftest import new_game, play_turn
+from src.uno import GameStatus
+from src.views import ViewStore
+
+
+def full_view(gc, viewer):
+    current = gc.turn_tracker.get_current_turn_player()
+
+    return {
+        'version': gc.version,
+        'status': gc.get_status().value,
+        'top_card': gc.discard_pile.get_last_card(),
+        'color_in_play': gc.color_in_play,
+        'current_turn_player_id': current.player_id if current else None,
+        'hand': viewer.hand,
+        'hand_sizes': {str(p.player_id): len(p.hand) for p in gc.players},
+        'winners': [p.player_id for p in gc.winners],
+    }
+
+
+def test_views_follow_every_event_of_a_game():
+    views = ViewStore()
+    gc = new_game(views.watch, seed=7)
+    rng = random.Random(1)
+
+    while gc.get_status() != GameStatus.FINISHED and len(gc.history) < 2000:
+        play_turn(gc, rng)
+
+        for viewer in gc.players:
+            view = views.get_view(gc, viewer.player_id)
+            assert {k: view[k] for k in full_view(gc, viewer)} == full_view(gc, viewer)
+
+
+def test_events_since_a_version():
+    views = ViewStore(tail_size=5)
+    gc = new_game(views.watch, seed=7)
+    viewer = gc.players[0]
+    rng = random.Random(2)
+
+    for _ in range(3):
+        play_turn(gc, rng)
+
+    version = views.get_view(gc, viewer.player_id)['version']
+    assert views.get_view(gc, viewer.player_id, since=version)['events'] == []
+
+    play_turn(gc, rng)
+    view = views.get_view(gc, viewer.player_id, since=version)
+    assert [e['version'] for e in view['events']] == list(range(version + 1, gc.version + 1))
+    assert not view['truncated']
+
+    for _ in range(10):
+        play_turn(gc, rng)
+    view = views.get_view(gc, viewer.player_id, since=version)
+    assert view['truncated']
+    assert view['events'][-1]['version'] == gc.version
+
+
+def test_hands_stay_private():
+    views = ViewStore()
+    gc = new_game(views.watch, seed=7)
+    viewer, other = gc.players[:2]
+
+    view = views.get_view(gc, viewer.player_id)
+
+    assert view['hand'] == viewer.hand
+    assert view['hand_sizes'][str(other.player_id)] == len(other.hand)
+    assert all('drawn_cards' not in e for e in view['events'])
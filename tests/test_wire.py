@@ -0,0 +1,90 @@
+import msgpack
+import pytest
+from fastapi.testclient import TestClient
+
+from conftest import create_game
+from src import wire
+from src.main import create_app
+from src.uno import CARD_TYPES, UnoInvalidCardException, card_from_id, card_to_id
+
+
+MSGPACK = {'Content-Type': wire.MSGPACK, 'Accept': wire.MSGPACK}
+BOT = {'X-Bot-Token': 'bot'}
+
+
+@pytest.fixture(scope='module')
+def client():
+    app = create_app({'turn_timeout': 0, 'bot_tokens': ['bot']})
+
+    with TestClient(app) as client:
+        yield client
+
+
+def current_turn(client, game_id):
+    gc = client.app.state.uno.get_game_by_id(game_id)
+    return gc, gc.turn_tracker.get_current_turn_player()
+
+
+def test_responses_follow_the_accept_header(client):
+    game_id, _ = create_game(client)
+
+    packed = client.get(f'/game/{game_id}/state', headers={'Accept': wire.MSGPACK})
+    plain = client.get(f'/game/{game_id}/state')
+
+    assert packed.headers['content-type'] == wire.MSGPACK
+    assert plain.headers['content-type'] == 'application/json'
+
+    # cards travel as their id
+    card = msgpack.unpackb(packed.content)['game_state']['last_played_card']
+    assert card == wire.compact_cards(plain.json()['game_state']['last_played_card'])
+
+
+def test_msgpack_bodies_are_validated_like_json(client):
+    game_id = client.post('/game/new').json()['game_id']
+
+    created = client.post(f'/game/{game_id}/player/new', content=msgpack.packb({'display_name': 'ann'}), headers=MSGPACK)
+    invalid = client.post(f'/game/{game_id}/player/new', content=msgpack.packb({}), headers=MSGPACK)
+
+    assert msgpack.unpackb(created.content)['player']['display_name'] == 'ann'
+    assert invalid.status_code == 422
+    assert invalid.headers['content-type'] == wire.MSGPACK
+    assert msgpack.unpackb(invalid.content)['detail'][0]['loc'] == ['body', 'display_name']
+
+
+def test_errors_are_packed_for_msgpack_clients(client):
+    response = client.get('/game/999999/state', headers={'Accept': wire.MSGPACK})
+
+    assert response.status_code == 404
+    assert msgpack.unpackb(response.content) == {'detail': 'Game 999999 not found'}
+
+
+def test_discard_with_a_card_id(client):
+    card = None
+    while card is None:
+        game_id, _ = create_game(client)
+        gc, player = current_turn(client, game_id)
+        card = next((c for c in player.hand if gc.is_valid_card_to_play(c)), None)
+
+    color_chosen = 'red' if card.can_choose_card_color else None
+    body = msgpack.packb({'card': card_to_id(card), 'color_chosen': color_chosen, 'say_uno': False})
+    response = client.post(f'/game/{game_id}/player/{player.player_id}/discard', content=body, headers=MSGPACK)
+
+    assert msgpack.unpackb(response.content)['success']
+    assert card_to_id(gc.discard_pile.get_last_card()) == card_to_id(card)
+
+
+@pytest.mark.parametrize('card_id', [-1, len(CARD_TYPES), True, '3', 2.0])
+def test_invalid_card_ids_are_rejected(client, card_id):
+    with pytest.raises(UnoInvalidCardException):
+        card_from_id(card_id)
+
+    game_id, _ = create_game(client)
+    _, player = current_turn(client, game_id)
+    path = f'/game/{game_id}/player/{player.player_id}/discard'
+
+    response = client.post(path, content=msgpack.packb({'card': card_id, 'say_uno': False}), headers=MSGPACK)
+    bot_response = client.post(f'/bot{path}', content=msgpack.packb([card_id, None, False]), headers=BOT)
+
+    assert response.status_code in (400, 422)
+    assert bot_response.status_code == 400
+    assert len(player.hand) == 7